@@ -1,5 +1,5 @@
-import smbus
 import time
+import threading
 from ADCDevice import *
 
 class ADC:
@@ -33,6 +33,41 @@ class ADC:
         #print(str(self.adc.address)+" "+str(val0)+" "+str(val1))
         return battery1,battery2
 
+class BatteryMonitor:
+    ''' Samples the battery voltages in the background at a low fixed rate.
+
+    Readings are smoothed with an exponential moving average, so power()
+    answers from the cached value without touching the bus.'''
+    def __init__(self, adc, rate=2, alpha=0.2, low=(5.5, 6.0)):
+        self.adc = adc
+        self.period = 1.0 / rate
+        self.alpha = alpha          # weight of a new reading
+        self.low = low              # (battery1, battery2) volts below which isLow() is true
+        self.error = None
+        self._voltage = self.adc.batteryPower()     # the first reading seeds the average
+        self._power = self._voltage
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def power(self):
+        "Smoothed (battery1, battery2) in volts, rounded like ADC.batteryPower"
+        return self._power
+
+    def isLow(self):
+        battery1, battery2 = self._power
+        return battery1 < self.low[0] or battery2 < self.low[1]
+
+    def _loop(self):
+        while True:
+            time.sleep(self.period)
+            try:
+                reading = self.adc.batteryPower()
+            except OSError as e:
+                self.error = e
+                continue
+            a = self.alpha
+            self._voltage = tuple(a * new + (1 - a) * old for new, old in zip(reading, self._voltage))
+            self._power = tuple(round(v, 2) for v in self._voltage)
 
 if __name__ == '__main__':
     print("start .. \n")
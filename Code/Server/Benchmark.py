@@ -0,0 +1,146 @@
+#coding:utf-8
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import Bus
+Bus.setBackend('sim')       # before Control opens its devices
+from Control import Control
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark.json')
+
+class Benchmark:
+    ''' Times the control path on the simulated bus.
+
+    Every case is timed call by call; results are frames/sec (from the mean)
+    and p50/p99 compute time in microseconds, plus I2C transactions and
+    modelled bus time per frame for the cases that reach the bus. compare() flags a case whose p50 time
+    grows by more than `tolerance`, or whose transaction count grows at all.
+    Each case runs `rounds` times and the fastest round is kept, which
+    filters out most scheduler noise.'''
+    def __init__(self, frames=2000, rounds=5, seed=0):
+        self.frames = frames
+        self.rounds = rounds
+        self.rng = np.random.default_rng(seed)
+        self.control = Control()
+        self.control.gait_scheduler.period = 0
+        self.control.balance_scheduler.period = 0
+        self.control.imu.calibrator.pause()      # keep IMU reads out of the bus counts
+        self.bus = Bus.simulatedBus()
+
+    def time(self, name, step, args):
+        "Time step(*a) for each a in args, after a short warm-up"
+        for a in args[:20]:
+            step(*a)
+        best = None
+        clock = time.perf_counter
+        for round in range(self.rounds):
+            self.control.output.flush()
+            self.bus.reset()
+            samples = np.empty(len(args))
+            for i, a in enumerate(args):
+                t = clock()
+                step(*a)
+                samples[i] = clock() - t
+            self.control.output.flush()
+            if best is None or np.median(samples) < np.median(best):
+                best = samples
+        samples = best
+        return {'name': name,
+                'frames': len(args),
+                'fps': len(args) / samples.sum(),
+                'p50_us': float(np.percentile(samples, 50) * 1e6),
+                'p99_us': float(np.percentile(samples, 99) * 1e6),
+                'transactions': self.bus.transactions / len(args),
+                'bus_us': self.bus.bus_time / len(args) * 1e6}
+
+    def feet(self):
+        "Random reachable feet, as (ox, oy, oz) for coordinateToAngle"
+        c = self.control
+        point = np.array(c.leg_point, dtype=float) + self.rng.uniform(-20, 20, (self.frames, 6, 3))
+        ok = c.workspace.reachable(point, limits=False).all(axis=1)
+        point = point[ok].reshape(-1, 3)[:self.frames]
+        return [(-z, x, y) for x, y, z in point.tolist()]
+
+    def attitudes(self):
+        return [tuple(a) for a in self.rng.uniform(-15, 15, (self.frames, 3)).tolist()]
+
+    def cases(self):
+        c = self.control
+        feet = self.feet()
+        angles = [tuple(c.coordinateToAngle(*f)) for f in feet]
+        attitudes = self.attitudes()
+        points = [(c.postureBalance(*a),) for a in attitudes]
+
+        def frame(point):
+            c.coordinateTransformation(point)
+            c.setLegAngle()
+
+        results = [self.time('coordinateToAngle', c.coordinateToAngle, feet),
+                   self.time('angleToCoordinate', c.angleToCoordinate, angles),
+                   self.time('postureBalance', c.postureBalance, attitudes),
+                   self.time('coordinateTransformation', c.coordinateTransformation, points),
+                   self.time('setLegAngle', frame, points)]
+        for gait in ('1', '2', '3'):
+            data = ['CMD_MOVE', gait, '0', '25', '10', '0']
+            c.gait_engine.reset()
+            c.gait_cache.clear()
+            results.append(self.time('walk gait ' + gait, c.walk, [(data,)] * self.frames))
+            # Same frames as one I2C_RDWR transfer each
+            Bus.setCombined(True)
+            results.append(self.time('walk gait %s rdwr' % gait, c.walk, [(data,)] * self.frames))
+            Bus.setCombined(False)
+            c.gait_engine.reset()
+            cycles = max(5, self.frames // 100)
+            results.append(self.time('run gait ' + gait, c.run, [(data,)] * cycles))
+        return results
+
+def compare(results, baseline, tolerance):
+    "Names of the cases that regressed against the baseline"
+    regressed = []
+    for r in results:
+        b = baseline.get(r['name'])
+        if b is None:
+            continue
+        if r['p50_us'] > b['p50_us'] * (1 + tolerance) or r['transactions'] > b['transactions'] + 1e-9:
+            regressed.append(r['name'])
+    return regressed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the kinematics and gait path on the simulated bus')
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed p50 slowdown (0.5 = 50%%)')
+    args = parser.parse_args()
+
+    results = Benchmark(args.frames, args.rounds).cases()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print("%-26s %8s %11s %10s %10s %7s %9s" % ('case', 'frames', 'frames/s', 'p50 us', 'p99 us', 'i2c', 'bus us'))
+    for r in results:
+        b = baseline.get(r['name'])
+        change = ' %+6.1f%%' % ((r['p50_us'] / b['p50_us'] - 1) * 100) if b else ''
+        print("%-26s %8d %11.1f %10.1f %10.1f %7.1f %9.1f%s" % (r['name'], r['frames'], r['fps'],
+              r['p50_us'], r['p99_us'], r['transactions'], r['bus_us'], change))
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({r['name']: r for r in results}, f, indent=2)
+        print("Baseline saved to " + args.baseline)
+        sys.exit(0)
+    if not baseline:
+        # Nothing to compare with is a failed check, not a pass
+        print("NO BASELINE: %s not found; run with --save on a known-good tree to create it" % args.baseline)
+        sys.exit(2)
+    missing = [r['name'] for r in results if r['name'] not in baseline]
+    if missing:
+        print("WARNING: not in the baseline, not checked: " + ", ".join(missing))
+    regressed = compare(results, baseline, args.tolerance)
+    if regressed:
+        print("PERFORMANCE REGRESSION: " + ", ".join(regressed))
+        sys.exit(1)
@@ -0,0 +1,482 @@
+#coding:utf-8
+import os
+import time
+import queue
+import struct
+import itertools
+import errno
+import threading
+import contextlib
+try:
+    import smbus
+except ImportError:
+    smbus = None    # off the robot: only the simulated bus is available
+try:
+    import smbus2
+except ImportError:
+    smbus2 = None   # no combined transfers: block writes go out one by one
+
+# Backend used by openBus(): 'smbus' (the real I2C bus) or 'sim'.
+# Set SPIDER_BUS=sim to run the motion code on a machine without the hardware.
+_backend = os.environ.get('SPIDER_BUS', 'smbus')
+# Device clients share the bus through a BusArbiter thread; SPIDER_ARBITER=0 turns it off
+_arbitrate = os.environ.get('SPIDER_ARBITER', '1') != '0'
+# SPIDER_I2C_RDWR=1 sends each batched servo frame as one I2C_RDWR ioctl (needs smbus2)
+_combined = os.environ.get('SPIDER_I2C_RDWR', '0') == '1'
+I2C_RDWR_MAX_MSGS = 42      # kernel limit on messages per I2C_RDWR ioctl
+_sim = None
+_arbiters = {}
+
+def setBackend(name):
+    global _backend
+    _backend = name
+
+def setArbitration(enabled):
+    global _arbitrate
+    _arbitrate = enabled
+
+def setCombined(enabled):
+    global _combined
+    _combined = enabled
+
+def openBus(bus=1, client=None):
+    """I2C bus handle for the selected backend; every device shares one simulated bus.
+    With a client name ('servo', 'imu', 'adc') the handle goes through the bus arbiter."""
+    global _sim
+    if client is not None and _arbitrate:
+        return arbiter(bus).client(client)
+    if _backend == 'sim':
+        if _sim is None:
+            _sim = SimulatedBus()
+        return _sim
+    if _combined and smbus2 is not None:
+        return CombinedBus(bus)
+    return smbus.SMBus(bus)
+
+def arbiter(bus=1):
+    "The arbiter that owns bus number `bus`"
+    if bus not in _arbiters:
+        _arbiters[bus] = BusArbiter(openBus(bus))
+    return _arbiters[bus]
+
+def simulatedBus():
+    "The shared simulated bus, or None when the real bus is in use"
+    return _sim if _backend == 'sim' else None
+
+def batch(bus):
+    "Context that sends the writes made inside it as one arbiter request, where the bus supports it"
+    return bus.batch() if hasattr(bus, 'batch') else contextlib.nullcontext()
+
+class CombinedBus:
+    ''' smbus2 bus that can send several block writes in one I2C_RDWR ioctl'''
+    def __init__(self, bus=1):
+        self._bus = smbus2.SMBus(bus)
+        self.combined = True
+
+    def __getattr__(self, name):
+        return getattr(self._bus, name)
+
+    def writeBlocks(self, blocks):
+        "Write [(addr, reg, data), ...] as one combined transfer, block by block if the adapter refuses"
+        if self.combined:
+            try:
+                for start in range(0, len(blocks), I2C_RDWR_MAX_MSGS):
+                    self._bus.i2c_rdwr(*[smbus2.i2c_msg.write(addr, [reg] + list(data))
+                                         for addr, reg, data in blocks[start:start + I2C_RDWR_MAX_MSGS]])
+                return
+            except OSError as e:
+                if e.errno != errno.EOPNOTSUPP:
+                    raise
+                self.combined = False
+        for addr, reg, data in blocks:
+            self._bus.write_i2c_block_data(addr, reg, list(data))
+
+class _Request:
+    __slots__ = ('client', 'calls', 'submitted', 'done', 'results', 'error')
+
+    def __init__(self, client, calls):
+        self.client = client
+        self.calls = calls
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class BusArbiter:
+    ''' Single owner thread for an I2C bus.
+
+    Clients queue requests (one or more bus calls) and wait for the result.
+    The thread runs them one request at a time, lowest priority number
+    first and in arrival order within a priority, so a servo frame never
+    waits behind a queue of IMU or battery reads.'''
+    PRIORITY = {'servo': 0, 'imu': 1, 'adc': 2}
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def client(self, name, priority=None):
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                if priority is None:
+                    priority = self.PRIORITY.get(name, len(self.PRIORITY))
+                client = self._clients[name] = BusClient(self, name, priority)
+            return client
+
+    def submit(self, client, calls):
+        "Run calls [(method, args), ...] back to back on the bus thread and return their results"
+        request = _Request(client, calls)
+        self._queue.put((client.priority, next(self._seq), request))
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _serve(self):
+        while True:
+            request = self._queue.get()[2]
+            start = time.monotonic()
+            try:
+                request.results = [getattr(self.bus, method)(*args) for method, args in request.calls]
+            except Exception as e:
+                request.error = e
+            request.client.account(start - request.submitted, time.monotonic() - start, len(request.calls))
+            request.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {name: client.stats() for name, client in self._clients.items()}
+
+class BusClient:
+    ''' smbus-style handle whose calls run on the arbiter thread.
+
+    Inside `with client.batch():` calls are collected and sent as a single
+    request when the block ends; they return None, so use it for writes.
+    With combined transfers on, a batch of block writes becomes one
+    writeBlocks call on the bus.'''
+    def __init__(self, arbiter, name, priority):
+        self.arbiter = arbiter
+        self.name = name
+        self.priority = priority
+        self.requests = 0
+        self.calls = 0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self.max_service = 0.0
+        self.total_service = 0.0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def batch(self):
+        local = self._local
+        if getattr(local, 'pending', None) is not None:
+            yield           # nested: the outer batch sends
+            return
+        local.pending = []
+        try:
+            yield
+        finally:
+            calls, local.pending = local.pending, None
+        if calls:
+            self.arbiter.submit(self, self._combine(calls))
+
+    def _combine(self, calls):
+        "Fold the block writes of a batch into one combined transfer when the transport has it"
+        if not (_combined and hasattr(self.arbiter.bus, 'writeBlocks')):
+            return calls
+        if len(calls) < 2 or any(method != 'write_i2c_block_data' for method, args in calls):
+            return calls
+        return [('writeBlocks', ([args for method, args in calls],))]
+
+    def _call(self, method, *args):
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.append((method, args))
+            return None
+        return self.arbiter.submit(self, [(method, args)])[0]
+
+    def account(self, wait, service, calls):
+        self.requests += 1
+        self.calls += calls
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_service += service
+        self.max_service = max(self.max_service, service)
+
+    def stats(self):
+        n = self.requests
+        return {'priority': self.priority,
+                'requests': n,
+                'calls': self.calls,
+                'mean_wait': self.total_wait / n if n else 0.0,
+                'max_wait': self.max_wait,
+                'mean_service': self.total_service / n if n else 0.0,
+                'max_service': self.max_service}
+
+    def write_byte(self, addr, value):
+        return self._call('write_byte', addr, value)
+
+    def read_byte(self, addr):
+        return self._call('read_byte', addr)
+
+    def write_byte_data(self, addr, reg, value):
+        return self._call('write_byte_data', addr, reg, value)
+
+    def read_byte_data(self, addr, reg):
+        return self._call('read_byte_data', addr, reg)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        return self._call('write_i2c_block_data', addr, reg, data)
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        return self._call('read_i2c_block_data', addr, reg, length)
+
+    def writeBlocks(self, blocks):
+        "Write [(addr, reg, data), ...] in one request, as one combined transfer where supported"
+        with self.batch():
+            for addr, reg, data in blocks:
+                self.write_i2c_block_data(addr, reg, data)
+
+    def close(self):
+        pass        # the arbiter owns the bus
+
+class PCA9685Model:
+    ''' Register model of a PCA9685: auto-increment and ALL_LED fan-out'''
+    MODE1 = 0x00
+    LED0_ON_L = 0x06
+    ALLLED_ON_L = 0xFA
+    ALLLED_OFF_H = 0xFD
+
+    def __init__(self):
+        self.regs = bytearray(256)
+        self.regs[self.MODE1] = 0x11                  # power-on: SLEEP | ALLCALL
+        for channel in range(16):
+            self.regs[self.LED0_ON_L + 4*channel + 3] = 0x10   # power-on: full off
+
+    def write(self, reg, data):
+        for value in data:
+            self.writeReg(reg, value)
+            if self.regs[self.MODE1] & 0x20:          # AI
+                reg = (reg + 1) & 0xFF
+
+    def writeReg(self, reg, value):
+        if self.ALLLED_ON_L <= reg <= self.ALLLED_OFF_H:
+            # ALL_LED registers load the same byte into every channel
+            for channel in range(16):
+                self.regs[self.LED0_ON_L + 4*channel + reg - self.ALLLED_ON_L] = value
+        else:
+            self.regs[reg] = value
+
+    def read(self, reg, length):
+        data = []
+        for i in range(length):
+            # ALL_LED registers always read back as zero
+            data.append(0 if self.ALLLED_ON_L <= reg <= self.ALLLED_OFF_H else self.regs[reg])
+            if self.regs[self.MODE1] & 0x20:
+                reg = (reg + 1) & 0xFF
+        return data
+
+    def channel(self, channel):
+        "(on, off) counts of a channel, with the full-on/full-off bit 12 included"
+        base = self.LED0_ON_L + 4*channel
+        r = self.regs
+        return r[base] | (r[base+1] & 0x1F) << 8, r[base+2] | (r[base+3] & 0x1F) << 8
+
+class MPU6050Model:
+    ''' Register model of an MPU6050 holding a fixed sample (level and at rest by default).
+
+    The FIFO fills in real time at the configured sample rate with the
+    enabled accel/temperature/gyro words, and overflows past 1024 bytes.'''
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    FIFO_EN = 0x23
+    INT_STATUS = 0x3A
+    USER_CTRL = 0x6A
+    FIFO_COUNTH = 0x72
+    FIFO_R_W = 0x74
+    FIFO_SIZE = 1024
+
+    def __init__(self):
+        self.regs = bytearray(256)
+        self.regs[0x6B] = 0x40                        # PWR_MGMT_1: sleep until woken
+        self.regs[0x75] = 0x68                        # WHO_AM_I
+        self.fifo = bytearray()
+        self._filled = time.monotonic()
+        self.setSample((0, 0, 16384), (0, 0, 0), 25.0)
+
+    def setSample(self, accel, gyro, temperature=25.0):
+        "Raw accel/gyro counts and temperature in degrees C"
+        temp = int(round((temperature - 36.53) * 340))
+        self.regs[0x3B:0x49] = struct.pack('>7h', accel[0], accel[1], accel[2], temp,
+                                           gyro[0], gyro[1], gyro[2])
+
+    def sampleRate(self):
+        # Gyro output rate is 8 kHz with the DLPF off (DLPF_CFG 0 or 7), 1 kHz otherwise
+        base = 8000 if self.regs[self.CONFIG] & 0x07 in (0, 7) else 1000
+        return base / (1 + self.regs[self.SMPLRT_DIV])
+
+    def _fill(self):
+        now = time.monotonic()
+        enabled = self.regs[self.FIFO_EN]
+        if not (self.regs[self.USER_CTRL] & 0x40 and enabled & 0xF8):
+            self._filled = now
+            return
+        count = int((now - self._filled) * self.sampleRate())
+        if count <= 0:
+            return
+        self._filled += count / self.sampleRate()
+        r = self.regs
+        sample = (r[0x3B:0x41] if enabled & 0x08 else b'') + (r[0x41:0x43] if enabled & 0x80 else b'') \
+            + (r[0x43:0x45] if enabled & 0x40 else b'') + (r[0x45:0x47] if enabled & 0x20 else b'') \
+            + (r[0x47:0x49] if enabled & 0x10 else b'')
+        self.fifo += sample * count
+        if len(self.fifo) > self.FIFO_SIZE:
+            del self.fifo[:len(self.fifo) - self.FIFO_SIZE]
+            self.regs[self.INT_STATUS] |= 0x10        # FIFO_OFLOW
+
+    def write(self, reg, data):
+        for value in data:
+            if reg == self.USER_CTRL and value & 0x04:
+                self.fifo.clear()                     # FIFO_RESET
+                self._filled = time.monotonic()
+                value &= ~0x04
+            self.regs[reg] = value
+            reg = (reg + 1) & 0xFF
+
+    def read(self, reg, length):
+        self._fill()
+        if reg == self.FIFO_R_W:
+            data = list(self.fifo[:length])
+            del self.fifo[:length]
+            return data + [0] * (length - len(data))
+        if reg <= self.FIFO_COUNTH + 1 < reg + length:
+            self.regs[self.FIFO_COUNTH:self.FIFO_COUNTH + 2] = struct.pack('>H', len(self.fifo))
+        data = list(self.regs[reg:reg + length])
+        if reg <= self.INT_STATUS < reg + length:
+            self.regs[self.INT_STATUS] = 0            # cleared on read
+        return data
+
+class ADS7830Model:
+    ''' ADS7830 8-channel ADC: the command byte selects the channel to convert'''
+    def __init__(self, value=136):
+        self.values = [value] * 8                     # 136 counts = 8.0 V after the 1:3 divider
+
+    def write(self, reg, data):
+        pass
+
+    def read(self, cmd, length):
+        c = (cmd >> 4) & 0x07
+        channel = (c >> 2) | (c & 0x01) << 1 | (c & 0x02) << 1   # undo ADS7830.analogRead's bit order
+        return [self.values[channel]] * length
+
+class SimulatedBus:
+    ''' In-memory stand-in for smbus.SMBus with transaction accounting.
+
+    Every call counts as one transaction (one ioctl on the real bus). Bus time
+    is modelled from the bits on the wire at `clock` Hz plus a fixed per-call
+    overhead for the kernel round trip.'''
+    def __init__(self, clock=100000, overhead=50e-6, realtime=False):
+        self.clock = clock
+        self.overhead = overhead
+        self.realtime = realtime          # sleep for the modelled bus time
+        self.devices = {0x40: PCA9685Model(), 0x41: PCA9685Model(),
+                        0x68: MPU6050Model(), 0x48: ADS7830Model()}
+        self.reset()
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_time = 0.0
+        self.by_address = {}
+
+    def stats(self):
+        return {'transactions': self.transactions,
+                'bytes': self.bytes,
+                'bus_time': self.bus_time,
+                'by_address': dict(self.by_address)}
+
+    def _device(self, addr):
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(121, 'Remote I/O error')    # no ACK, as smbus reports it
+        return device
+
+    def _transfer(self, messages):
+        "Account one ioctl carrying messages [(addr, data bytes), ...]"
+        # Each message: (repeated) START + address byte + data bytes, each byte 9 clocks; one STOP
+        bits = sum(9 * (1 + n) for addr, n in messages) + len(messages) + 1
+        duration = bits / self.clock + self.overhead
+        self.transactions += 1
+        self.bus_time += duration
+        for addr, n in messages:
+            self.bytes += n
+            count = self.by_address.setdefault(addr, [0, 0])   # messages, bytes
+            count[0] += 1
+            count[1] += n
+        if self.realtime:
+            time.sleep(duration)
+
+    def write_byte(self, addr, value):
+        self._device(addr)
+        self._transfer([(addr, 1)])
+
+    def read_byte(self, addr):
+        self._transfer([(addr, 1)])
+        return self._device(addr).read(0, 1)[0]
+
+    def write_byte_data(self, addr, reg, value):
+        self._device(addr).write(reg, [value])
+        self._transfer([(addr, 2)])
+
+    def read_byte_data(self, addr, reg):
+        value = self._device(addr).read(reg, 1)[0]
+        self._transfer([(addr, 1), (addr, 1)])
+        return value
+
+    def write_i2c_block_data(self, addr, reg, data):
+        self._device(addr).write(reg, list(data))
+        self._transfer([(addr, 1 + len(data))])
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        data = self._device(addr).read(reg, length)
+        self._transfer([(addr, 1), (addr, length)])
+        return data
+
+    def writeBlocks(self, blocks):
+        "Write [(addr, reg, data), ...] as one combined I2C_RDWR transfer"
+        for start in range(0, len(blocks), I2C_RDWR_MAX_MSGS):
+            part = blocks[start:start + I2C_RDWR_MAX_MSGS]
+            for addr, reg, data in part:
+                self._device(addr).write(reg, list(data))
+            self._transfer([(addr, 1 + len(data)) for addr, reg, data in part])
+
+    def close(self):
+        pass
+
+if __name__ == '__main__':
+    # Report the I2C cost of each gait frame with the simulated bus
+    import Bus      # the instance Control imports, not __main__
+    Bus.setBackend('sim')
+    from Control import Control
+    c = Control()
+    c.gait_scheduler.period = 0
+    c.imu.calibrator.pause()     # only the servo traffic is counted
+    bus = Bus.simulatedBus()
+    for data in (['CMD_MOVE', '1', '0', '25', '10', '0'], ['CMD_MOVE', '2', '0', '25', '10', '0']):
+        c.gait_engine.reset()
+        c.output.flush()
+        bus.reset()
+        frames = 0
+        while c.gait_engine.cycles < 2:
+            c.walk(data)
+            frames += 1
+        c.output.flush()
+        s = bus.stats()
+        print("gait %s: %d frames, %.1f transactions, %.1f bytes, %.3f ms bus time per frame"
+              % (data[1], frames, s['transactions']/frames, s['bytes']/frames, s['bus_time']/frames*1000))
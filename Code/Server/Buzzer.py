@@ -1,4 +1,5 @@
 import time
+import threading
 import RPi.GPIO as GPIO
 class Buzzer:
     def __init__(self):
@@ -6,11 +7,24 @@ class Buzzer:
         self.Buzzer_Pin = 17
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.Buzzer_Pin,GPIO.OUT)
+        self.thread_beep=None
     def run(self,command):
         if command!="0":
             GPIO.output(self.Buzzer_Pin,True)
         else:
             GPIO.output(self.Buzzer_Pin,False)
+    def beep(self,count=3,on=0.15,off=0.1):
+        "Play count beeps on a background thread; ignored while a pattern is still playing"
+        if self.thread_beep is not None and self.thread_beep.is_alive():
+            return
+        self.thread_beep=threading.Thread(target=self._beep,args=(count,on,off),daemon=True)
+        self.thread_beep.start()
+    def _beep(self,count,on,off):
+        for i in range(count):
+            self.run("1")
+            time.sleep(on)
+            self.run("0")
+            time.sleep(off)
 if __name__=='__main__':
     B=Buzzer()
     B.run('1')
@@ -1,28 +1,40 @@
 # -*- coding: utf-8 -*-
 import time
 import math
-import smbus
 from IMU import *
 from PID import *
 import threading
 from Servo import*
+from GaitCache import GaitCache
+from Scheduler import FrameScheduler
+from Gait import GaitEngine,GAITS
+from Mailbox import CommandMailbox
+from Output import ServoOutput
+from IKCache import IKCache
+from Workspace import Workspace
 import numpy as np
-import RPi.GPIO as GPIO
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None     # off the robot, with the simulated bus
 from Command import COMMAND as cmd
 class Control:
     def __init__(self):
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
         self.GPIO_4 = 4
-        GPIO.setup(self.GPIO_4,GPIO.OUT)
-        GPIO.output(self.GPIO_4,False)
+        if GPIO is not None:
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.GPIO_4,GPIO.OUT)
+            GPIO.output(self.GPIO_4,False)
         self.imu=IMU()
+        self.imu_publisher=IMUPublisher(self.imu)
         self.servo=Servo()
         self.move_flag=0x01
         self.relax_flag=False
         self.pid = Incremental_PID(0.500,0.00,0.0025)
         self.flag=0x00
-        self.timeout=0
+        # Orders from the network thread; relaxes the servos after 10 s without one
+        self.mailbox=CommandMailbox(relax_after=10)
         self.height=-25
         self.body_point=[[137.1 ,189.4 , self.height], [225, 0, self.height], [137.1 ,-189.4 , self.height], 
                          [-137.1 ,-189.4 , self.height], [-225, 0, self.height], [-137.1 ,189.4 , self.height]]
@@ -44,6 +56,31 @@ class Control:
                                         [-137.1,-189.4, 0],
                                         [-225,    0,    0],
                                         [-137.1, 189.4, 0]]).T
+        # Servo mirroring applied after calibration: angle = base + sign*(ik + offset).
+        # Legs 1-3 flip the femur around 90 deg, legs 4-6 flip the tibia around 180 deg (see SERVO_MAP).
+        self._mirror_base,self._mirror_sign = legMirror()
+        self.gait_engine=GaitEngine(self.body_point)
+        # Reachable foot positions per leg; joint limits follow calibration()
+        self.workspace=Workspace(self.coordinateToAngleExact)
+        self._checked_key=None
+        self._stride_scale=1.0
+        # Optional IK memo, see setIKCache()
+        self.ik_cache=None
+        # IK angle → duty table, rebuilt by calibration(); see setDutyResolution()
+        self._duty_steps=1
+        # Compiled gait cycles keyed by move parameters; flushed on calibration
+        self.gait_cache=GaitCache()
+        self._cycle_key=None
+        self._cycle=None
+        self._recording=None
+        self._pose_stale=False
+        # 8 ms gait frames keep ~2 updates per servo PWM cycle (50 Hz = 20 ms period);
+        # late frames are dropped so step cadence stays locked to the clock
+        self.gait_scheduler=FrameScheduler(0.008,FrameScheduler.DROP)
+        self.balance_scheduler=FrameScheduler(0.02,FrameScheduler.DROP)
+        # Leg frames go out from a writer thread paced by the gait scheduler
+        self.output=ServoOutput(self.servo,self.gait_scheduler)
+        self.setSlewRate(180)
         self.calibration()
         self.setLegAngle()
         self.Thread_conditiona=threading.Thread(target=self.condition)
@@ -84,6 +121,73 @@ class Control:
         b=round(math.degrees(b))
         c=round(math.degrees(c))
         return a,b,c
+    def coordinateToAngleBatch(self,ox,oy,oz,l1=33,l2=90,l3=110,exact=False):
+        """Array version of coordinateToAngle: returns an N x 3 array of (a,b,c) with identical rounding.
+        exact=True skips all rounding and returns float angles"""
+        ox=np.asarray(ox,dtype=float)
+        oy=np.asarray(oy,dtype=float)
+        oz=np.asarray(oz,dtype=float)
+        a,w,v,u=self._ikTerms(ox,oy,oz,l1,l2,l3)
+        w=np.clip(w,-1,1)
+        v=np.clip(v,-1,1)
+        u=np.clip(u,-1,1)
+        if exact:
+            b=np.arcsin(w)-np.arccos(v)
+            c=math.pi-np.arccos(u)
+            return np.degrees(np.stack((a,b,c),axis=-1))
+        b=np.arcsin(np.round(w,2))-np.arccos(np.round(v,2))
+        c=math.pi-np.arccos(np.round(u,2))
+        angle=np.stack((np.degrees(a),np.degrees(b),np.degrees(c)),axis=-1)
+        # np.round(x,2) scales by 100 first, so it can disagree with round(x,2) on values
+        # sitting next to a rounding tie; those legs (in practice none) take the scalar path
+        fragile=self._nearTie(np.stack((w*100,v*100,u*100),axis=-1)).any(axis=-1)|self._nearTie(angle).any(axis=-1)
+        angle=np.rint(angle).astype(int)
+        for i in np.flatnonzero(fragile):
+            angle[i]=self.coordinateToAngle(ox[i],oy[i],oz[i],l1,l2,l3)
+        return angle
+    def _ikTerms(self,ox,oy,oz,l1,l2,l3):
+        "Coxa angle (rad) and the unclamped sine/cosine terms of the femur and tibia solution"
+        a=math.pi/2-np.arctan2(oz,oy)
+        x_4=l1*np.sin(a)
+        x_5=l1*np.cos(a)
+        l23=np.sqrt((oz-x_5)**2+(oy-x_4)**2+ox**2)
+        w=ox/l23
+        v=(l2*l2+l23*l23-l3*l3)/(2*l2*l23)
+        u=(l2**2+l3**2-l23**2)/(2*l3*l2)
+        return a,w,v,u
+    def coordinateToAngleExact(self,ox,oy,oz,l1=33,l2=90,l3=110,margin=0.0):
+        """Unrounded IK angles (N x 3, degrees) and, per point, whether it solves without
+        clamping; margin tightens the no-clamp test"""
+        ox=np.asarray(ox,dtype=float)
+        oy=np.asarray(oy,dtype=float)
+        oz=np.asarray(oz,dtype=float)
+        a,w,v,u=self._ikTerms(ox,oy,oz,l1,l2,l3)
+        limit=1-margin
+        solved=(np.abs(w)<=limit)&(np.abs(v)<=limit)&(np.abs(u)<=limit)
+        w=np.clip(w,-1,1)
+        v=np.clip(v,-1,1)
+        u=np.clip(u,-1,1)
+        angle=np.degrees(np.stack((a,np.arcsin(w)-np.arccos(v),math.pi-np.arccos(u)),axis=-1))
+        return angle,solved
+    def _nearTie(self,value):
+        return np.abs(np.abs(value-np.floor(value))-0.5)<1e-7
+    def setIKCache(self,resolution=1.0,max_entries=8192):
+        "Memoize setLegAngle's IK on a resolution-mm grid; resolution=None turns it off"
+        if resolution is None:
+            self.ik_cache=None
+        else:
+            self.ik_cache=IKCache(self.coordinateToAngleBatch,resolution,max_entries)
+        # Recorded gait frames came from the previous IK settings
+        self.gait_cache.clear()
+        self._cycle_key=None
+        self._cycle=None
+    def setDutyResolution(self,steps=1):
+        "Entries per degree of the duty table; above 1 the IK is no longer rounded to whole degrees"
+        self._duty_steps=steps
+        self.duty_table=DutyTable(self._calibration_offset,self._mirror_base,self._mirror_sign,steps)
+        self.gait_cache.clear()
+        self._cycle_key=None
+        self._cycle=None
     def angleToCoordinate(self,a,b,c,l1=33,l2=90,l3=110):
         a=math.pi/180*a
         b=math.pi/180*b
@@ -92,6 +196,15 @@ class Control:
         oy=round(l3*math.sin(a)*math.cos(b+c)+l2*math.sin(a)*math.cos(b)+l1*math.sin(a))
         oz=round(l3*math.cos(a)*math.cos(b+c)+l2*math.cos(a)*math.cos(b)+l1*math.cos(a))
         return ox,oy,oz
+    def angleToCoordinateBatch(self,a,b,c,l1=33,l2=90,l3=110):
+        "Array version of angleToCoordinate"
+        a=np.radians(a)
+        b=np.radians(b)
+        c=np.radians(c)
+        ox=np.rint(l3*np.sin(b+c)+l2*np.sin(b))
+        oy=np.rint(l3*np.sin(a)*np.cos(b+c)+l2*np.sin(a)*np.cos(b)+l1*np.sin(a))
+        oz=np.rint(l3*np.cos(a)*np.cos(b+c)+l2*np.cos(a)*np.cos(b)+l1*np.cos(a))
+        return ox,oy,oz
     def calibration(self):
         self.leg_point=[[140, 0, 0], [140, 0, 0], [140, 0, 0], [140, 0, 0], [140, 0, 0], [140, 0, 0]]
         for i in range(6):
@@ -107,40 +220,55 @@ class Control:
             self.calibration_angle[i][0]=self.calibration_angle[i][0]-self.angle[i][0]
             self.calibration_angle[i][1]=self.calibration_angle[i][1]-self.angle[i][1]
             self.calibration_angle[i][2]=self.calibration_angle[i][2]-self.angle[i][2]
+        self._calibration_offset=np.array(self.calibration_angle)
+        self.workspace.setLimits(self._calibration_offset,self._mirror_base,self._mirror_sign)
+        self.duty_table=DutyTable(self._calibration_offset,self._mirror_base,self._mirror_sign,self._duty_steps)
+        self._checked_key=None
+        self.gait_cache.clear()
+        self._cycle_key=None
+        self._cycle=None
     
-    def setLegAngle(self):
+    def setSlewRate(self,rate):
+        "Joint speed limit (deg/s, scalar or 6×3) for pose changes; None lets them jump"
+        self.output.setRate(None if rate is None else self.servo.legRate(rate))
+    def setLegAngle(self,slew=True):
+        "Move the legs to leg_point; with slew the output stage ramps there at the setSlewRate limit"
         if self.checkPoint():
-            for i in range(6):
-                self.angle[i][0],self.angle[i][1],self.angle[i][2]=self.coordinateToAngle(-self.leg_point[i][2],
-                                                                                          self.leg_point[i][0],
-                                                                                          self.leg_point[i][1])
-            for i in range(3):
-                self.angle[i][0]=self.restriction(self.angle[i][0]+self.calibration_angle[i][0],0,180)
-                self.angle[i][1]=self.restriction(90-(self.angle[i][1]+self.calibration_angle[i][1]),0,180)
-                self.angle[i][2]=self.restriction(self.angle[i][2]+self.calibration_angle[i][2],0,180)
-                self.angle[i+3][0]=self.restriction(self.angle[i+3][0]+self.calibration_angle[i+3][0],0,180)
-                self.angle[i+3][1]=self.restriction(90+self.angle[i+3][1]+self.calibration_angle[i+3][1],0,180)
-                self.angle[i+3][2]=self.restriction(180-(self.angle[i+3][2]+self.calibration_angle[i+3][2]),0,180)
-             
-            # Write all 18 servos in 4 batched I2C block writes instead of 72 individual writes
-            self.servo.setLegServoBatch(self.angle)
+            point=np.asarray(self.leg_point,dtype=float)
+            if self.ik_cache is None:
+                exact=self.duty_table.steps>1
+                angle=self.coordinateToAngleBatch(-point[:,2],point[:,0],point[:,1],exact=exact)
+            else:
+                angle=self.ik_cache.angles(-point[:,2],point[:,0],point[:,1])
+            # Calibration, mirroring, clamping and angle→duty in one table gather
+            duty=self.duty_table.duty(angle)
+            self.output.submit(duty,slew)
+            return duty
         else:
             print("This coordinate point is out of the active range")
     def checkPoint(self):
-        flag=True
-        leg_lenght=[0,0,0,0,0,0]  
-        for i in range(6):
-          leg_lenght[i]=math.sqrt(self.leg_point[i][0]**2+self.leg_point[i][1]**2+self.leg_point[i][2]**2)
-        for i in range(6):
-          if leg_lenght[i] > 248 or leg_lenght[i] < 90:
-            flag=False
-        return flag
+        "True when every foot is in the 90-248 mm band and solvable without clamping the IK"
+        # Joint limits are still left to the 0-180 clamp in setLegAngle
+        return bool(self.workspace.reachable(self.leg_point,limits=False).all())
+    def checkTrajectory(self,point):
+        """Per-frame reachability, joint limits included, of an (..., 6, 3) array of body-frame foot points.
+        Every point goes through the exact IK: a move's cycle is checked once, not per frame."""
+        return self.workspace.exact(self.legPoints(point)).all(axis=-1)
     def condition(self):
         while True:
-            if (time.time()-self.timeout)>10 and  self.timeout!=0 and self.order[0]=='':
-                self.timeout=time.time()
-                self.relax(True)
-                self.flag=0x00
+            if self.order[0]=='':
+                # Idle: sleep until an order arrives or the relax deadline passes
+                order=self.mailbox.wait()
+                if order is None:
+                    self.relax(True)
+                    self.flag=0x00
+                    continue
+                self.order=order
+            else:
+                # Still walking: a newer order takes over on the next frame
+                order=self.mailbox.poll()
+                if order is not None:
+                    self.order=order
             if cmd.CMD_POSITION in self.order and len(self.order)==4:
                 if self.flag!=0x01:
                     self.relax(False)
@@ -148,6 +276,7 @@ class Control:
                 y=self.restriction(int(self.order[2]),-40,40)
                 z=self.restriction(int(self.order[3]),-20,20)
                 self.posittion(x,y,z)
+                self.imu.calibrator.setLevel(True)
                 self.flag=0x01
                 self.order=['','','','','',''] 
             elif cmd.CMD_ATTITUDE in self.order and len(self.order)==4:
@@ -159,17 +288,21 @@ class Control:
                 point=self.postureBalance(r,p,y)
                 self.coordinateTransformation(point)
                 self.setLegAngle()
+                # Only an untilted body is level enough for the bias estimate
+                self.imu.calibrator.setLevel(r==0 and p==0)
                 self.flag=0x02
                 self.order=['','','','','',''] 
             elif cmd.CMD_MOVE in self.order and len(self.order)==6:
-                if self.order[2] =="0" and self.order[3] =="0":
-                    self.run(self.order)
-                    self.order=['','','','','',''] 
-                else:
-                    if self.flag!=0x03:
-                        self.relax(False)
-                    self.run(self.order)
+                # One frame per pass, so a new order takes effect on the next frame
+                if self.flag!=0x03:
+                    # A walk starts (straight or turning in place): from rest, on the standing pose
+                    self.gait_engine.reset()
+                    self.standForWalk()
+                    self.imu.calibrator.setLevel(True)
                     self.flag=0x03
+                if not self.walk(self.order):
+                    # At rest: a stop order, or a move with no reachable stride
+                    self.order=['','','','','',''] 
             elif cmd.CMD_BALANCE in self.order and len(self.order)==2:
                 if self.order[1] =="1":
                     self.order=['','','','','',''] 
@@ -177,8 +310,11 @@ class Control:
                         self.relax(False)
                     self.flag=0x04
                     self.imu6050()
+                    # Left holding the last balance correction, not the level pose
+                    self.imu.calibrator.setLevel(False)
             elif cmd.CMD_CALIBRATION in self.order:
-                self.timeout=0
+                self.mailbox.cancelRelax()
+                self.imu.calibrator.setLevel(False)
                 self.calibration()
                 self.setLegAngle()
                 if len(self.order) >=2:
@@ -221,10 +357,19 @@ class Control:
                     elif self.order[1]=="save":
                         self.saveToTxt(self.calibration_leg_point,'point')
                 self.order=['','','','','',''] 
+            if not (cmd.CMD_MOVE in self.order and len(self.order)==6):
+                # Only a walk in progress stays current; anything else is done
+                self.order=['','','','','',''] 
     def relax(self,flag):
         if flag:
+            self.output.release()
             self.servo.relax()
+            self.imu.calibrator.setLevel(False)
         else:
+            if self._pose_stale:
+                # Replayed gait frames skip the kinematics; rebuild leg_point first
+                self.coordinateTransformation(self.gait_engine.points())
+                self._pose_stale=False
             self.setLegAngle()
         
     def coordinateTransformation(self,point):
@@ -235,6 +380,17 @@ class Control:
             self.leg_point[i][1] = -point[i][0]*s + point[i][1]*c
             self.leg_point[i][2] =  point[i][2] - 14
     
+    def legPoints(self,point):
+        "Array version of coordinateTransformation for (..., 6, 3) body-frame points"
+        point=np.asarray(point,dtype=float)
+        c=np.array(self._leg_cos)
+        s=np.array(self._leg_sin)
+        leg=np.empty(point.shape)
+        leg[...,0]= point[...,0]*c+point[...,1]*s+self._leg_offset_x
+        leg[...,1]=-point[...,0]*s+point[...,1]*c
+        leg[...,2]= point[...,2]-14
+        return leg
+
     def restriction(self,var,v_min,v_max):
         if var < v_min:
             return v_min
@@ -281,133 +437,153 @@ class Control:
         point=self.postureBalance(0,0,0)
         self.coordinateTransformation(point)
         self.setLegAngle()
-        time.sleep(2)
-        self.imu.Error_value_accel_data,self.imu.Error_value_gyro_data=self.imu.average_filter()
-        time.sleep(1)
+        # Stand still on the level pose; the stored bias is reused unless it is stale
+        self.output.flush()
+        if self.imu.staleBias():
+            self.imu.calibrate()
+        # The IMU thread filters every 500 Hz FIFO sample on its own schedule;
+        # each balance frame uses the newest attitude without waiting on the bus
+        self.imu_publisher.start()
+        self.balance_scheduler.start()
+        seq=0
         while True:
-            if self.order[0]!="":
+            if self.mailbox.pending():
+                self.imu_publisher.stop()
                 break
-            _t = time.time()
-            r,p,y=self.imu.imuUpdate()
+            sample=self.imu_publisher.latest()
+            if sample is None or sample.seq==seq:
+                self.balance_scheduler.wait()
+                continue
+            seq=sample.seq
+            r,p,y=sample.pitch,sample.roll,sample.yaw
             #r=self.restriction(self.pid.PID_compute(r),-15,15)
             #p=self.restriction(self.pid.PID_compute(p),-15,15)
             r=self.pid.PID_compute(r)
             p=self.pid.PID_compute(p)
             point=self.postureBalance(r,p,0)
             self.coordinateTransformation(point)
-            self.setLegAngle()
-            # Sleep only the remaining time to maintain ~50 Hz update rate
-            time.sleep(max(0.0, 0.02 - (time.time() - _t)))
+            self.setLegAngle(False)
+            self.balance_scheduler.wait()
  
     def run(self,data,Z=40,F=64):#example : data=['CMD_MOVE', '1', '0', '25', '10', '0']
+        "Walk one full-stride gait cycle of the move in data, then come to rest with all six feet down"
+        engine=self.gait_engine
+        rest=['CMD_MOVE',data[1],'0','0',data[4],'0']
+        if data[1]!=engine.gait:
+            # Another gait: finish the current one first, so this call steps from the start
+            while self.walk(rest,Z):
+                pass
+        if not engine.moving():
+            self.standForWalk()
+        # Ramp up to the full stride, then walk one whole cycle of it
+        while self.walk(data,Z) and not engine.steady():
+            pass
+        if engine.steady():
+            end=engine.cycles*engine.frames+engine.frame+engine.frames
+            while self.walk(data,Z) and engine.cycles*engine.frames+engine.frame<end:
+                pass
+        while self.walk(rest,Z):
+            pass
+        self.output.flush()
+
+    def standForWalk(self):
+        "Ramp the legs to the gait's standing pose at the slew limit and wait until they are there"
+        engine=self.gait_engine
+        engine.height=self.height
+        self.coordinateTransformation(engine.points())
+        self.setLegAngle()
+        self._pose_stale=False
+        self.output.flush()
+
+    def walk(self,data,Z=40):
+        "Stream one gait frame toward the move in data; returns False once the legs are at rest"
         gait=data[1]
         x=self.restriction(int(data[2]),-35,35)
         y=self.restriction(int(data[3]),-35,35)
-        if gait=="1" :
-            F=round(self.map(int(data[4]),2,10,126,22))
-        else:
-            F=round(self.map(int(data[4]),2,10,171,45))
+        # Cycle length for speed 2..10 comes from the gait pattern
+        slow,fast=GAITS[gait].frames if gait in GAITS else GAITS["2"].frames
+        F=round(self.map(int(data[4]),2,10,slow,fast))
         angle=int(data[5])
-        z=Z/F
-        delay=0.008  # 8 ms — keeps ~2 updates per servo PWM cycle (50 Hz = 20 ms period)
-        point=[row[:] for row in self.body_point]
         #if y < 0:
         #   angle=-angle
         if angle!=0:
             x=0
-        xy=[[0,0],[0,0],[0,0],[0,0],[0,0],[0,0]]
-        for i in range(6):
-            xy[i][0]=((point[i][0]*math.cos(angle/180*math.pi)+point[i][1]*math.sin(angle/180*math.pi)-point[i][0])+x)/F
-            xy[i][1]=((-point[i][0]*math.sin(angle/180*math.pi)+point[i][1]*math.cos(angle/180*math.pi)-point[i][1])+y)/F
-        if x == 0 and y == 0 and angle==0:
-            self.coordinateTransformation(point)
-            self.setLegAngle()
-        elif gait=="1" :
-            # Pre-compute phase boundaries once instead of re-dividing every frame
-            F_8  = F / 8
-            F_4  = F / 4
-            F3_8 = 3 * F / 8
-            F5_8 = 5 * F / 8
-            F3_4 = 3 * F / 4
-            F7_8 = 7 * F / 8
-            for j in range (F):
-                for i in range(3):
-                    if j< F_8:
-                        point[2*i][0]=point[2*i][0]-4*xy[2*i][0]
-                        point[2*i][1]=point[2*i][1]-4*xy[2*i][1]
-                        point[2*i+1][0]=point[2*i+1][0]+8*xy[2*i+1][0]
-                        point[2*i+1][1]=point[2*i+1][1]+8*xy[2*i+1][1]
-                        point[2*i+1][2]=Z+self.height
-                    elif j< F_4:
-                        point[2*i][0]=point[2*i][0]-4*xy[2*i][0]
-                        point[2*i][1]=point[2*i][1]-4*xy[2*i][1]
-                        point[2*i+1][2]=point[2*i+1][2]-z*8
-                    elif j< F3_8:
-                        point[2*i][2]=point[2*i][2]+z*8
-                        point[2*i+1][0]=point[2*i+1][0]-4*xy[2*i+1][0]
-                        point[2*i+1][1]=point[2*i+1][1]-4*xy[2*i+1][1]
-                    elif j< F5_8:
-                        point[2*i][0]=point[2*i][0]+8*xy[2*i][0]
-                        point[2*i][1]=point[2*i][1]+8*xy[2*i][1]
+        engine=self.gait_engine
+        engine.command(gait,x,y,angle,F,Z,self.height)
+        key=(gait,x,y,F,angle,Z,self.height)
+        if key!=self._checked_key and engine.target.any():
+            # Check the whole cycle up front rather than failing part way through a step
+            self._checked_key=key
+            self._stride_scale=self.feasibleStride()
+        engine.target*=self._stride_scale
+        if not self._stride_scale:
+            # No reachable stride: refuse the move instead of marching in place
+            engine.target_lift=0.0
+        if not engine.moving():
+            self.coordinateTransformation(engine.points())
+            self.setLegAngle(False)
+            return False
+        if engine.steady():
+            # A converged stride repeats every cycle, so its frames are recorded once
+            # and then replayed from the gait cache with no kinematics in the loop
+            if key!=self._cycle_key:
+                self._cycle_key=key
+                self._cycle=self.gait_cache.get(key)
+                self._recording=[None]*F if self._cycle is None else None
+                self._recorded=0
+        else:
+            self._cycle_key=None
+            self._cycle=None
+            self._recording=None
+        if self._cycle is not None:
+            self.output.submit(self._cycle.frames[engine.frame])
+            self._pose_stale=True
+        else:
+            self.coordinateTransformation(engine.points())
+            duty=self.setLegAngle(False)
+            self._pose_stale=False
+            # Cycles with an out-of-range frame are never completed, so never cached
+            if self._recording is not None and duty is not None and self._recording[engine.frame] is None:
+                self._recording[engine.frame]=duty
+                self._recorded+=1
+                if self._recorded==F:
+                    self._cycle=self.gait_cache.put(self._cycle_key,self._recording)
+                    self._recording=None
+        # Dropped frames just move the phase on further
+        engine.advance(self.output.ticks())
+        return engine.moving()
 
-                        point[2*i+1][0]=point[2*i+1][0]-4*xy[2*i+1][0]
-                        point[2*i+1][1]=point[2*i+1][1]-4*xy[2*i+1][1]
-                    elif j< F3_4:
-                        point[2*i][2]=point[2*i][2]-z*8
-                        point[2*i+1][0]=point[2*i+1][0]-4*xy[2*i+1][0]
-                        point[2*i+1][1]=point[2*i+1][1]-4*xy[2*i+1][1]
-                    elif j< F7_8:
-                        point[2*i][0]=point[2*i][0]-4*xy[2*i][0]
-                        point[2*i][1]=point[2*i][1]-4*xy[2*i][1]
-                        point[2*i+1][2]=point[2*i+1][2]+z*8
-                    else:
-                        point[2*i][0]=point[2*i][0]-4*xy[2*i][0]
-                        point[2*i][1]=point[2*i][1]-4*xy[2*i][1]
-                        point[2*i+1][0]=point[2*i+1][0]+8*xy[2*i+1][0]
-                        point[2*i+1][1]=point[2*i+1][1]+8*xy[2*i+1][1]
-                self.coordinateTransformation(point)
-                self.setLegAngle()
-                time.sleep(delay)
-                
-        elif gait=="2":
-            aa=0
-            number=[5,2,1,0,3,4]
-            for i in range(6):
-                for j in range(int(F/6)):
-                    for k in range(6):
-                        if number[i] == k:
-                            if j <int(F/18):
-                                point[k][2]+=18*z
-                            elif j <int(F/9):
-                                point[k][0]+=30*xy[k][0]
-                                point[k][1]+=30*xy[k][1]
-                            elif j <int(F/6):
-                                point[k][2]-=18*z
-                        else:
-                            point[k][0]-=2*xy[k][0]
-                            point[k][1]-=2*xy[k][1]
-                    self.coordinateTransformation(point)
-                    self.setLegAngle()
-                    time.sleep(delay) 
-                    aa+=1
+    def feasibleStride(self):
+        "Largest share of the commanded stride whose whole gait cycle stays reachable"
+        engine=self.gait_engine
+        for scale in (1.0,0.75,0.5,0.25):
+            if self.checkTrajectory(engine.cyclePoints(engine.target*scale)).all():
+                if scale<1:
+                    print("This move is out of the active range, stride reduced to %d%%"%(scale*100))
+                return scale
+        print("This move is out of the active range")
+        return 0.0
                   
                              
 if __name__=='__main__':
-    pass
-    
-
-
-
-
-   
-   
-
-            
-        
-        
-        
-            
-        
-            
-
-  
+    # Walk checks on the simulated bus: python Control.py
+    import Bus
+    Bus.setBackend('sim')
+    c=Control()
+    c.imu.calibrator.pause()
+    c.gait_scheduler.period=0
+    engine=c.gait_engine
+    # A scripted run ends at rest with every foot down, also across a gait change
+    for data in (['CMD_MOVE','1','0','35','10','0'],['CMD_MOVE','2','35','0','10','10']):
+        cycles=engine.cycles
+        c.run(data)
+        assert engine.gait==data[1] and engine.cycles>cycles and not engine.moving()
+        assert (engine.points()[:,2]==c.height).all()
+    # A turn in place from idle advances the phase
+    c.flag=0x00
+    c.mailbox.post(['CMD_MOVE','1','0','0','10','10'])
+    thread=threading.Thread(target=c.condition,daemon=True)
+    thread.start()
+    time.sleep(1)
+    assert engine.cycles>0 and engine.stride.any()
+    print("walk checks passed")
@@ -0,0 +1,145 @@
+#coding:utf-8
+import math
+import numpy as np
+
+class GaitPattern:
+    ''' Periodic gait defined by per-leg phase offsets, duty factor and swing profile.
+
+    Each leg runs the same cycle, theta in [0,1): stance while theta < duty
+    (foot sweeps from +stride to -stride along the move), then swing, which
+    lifts for the first `lift` of the swing, carries the foot forward and
+    lowers it for the last `lift`. points() evaluates all legs at once.'''
+    def __init__(self, offset, duty, lift=0.25, stride=1.0, profile='trapezoid', frames=(126, 22)):
+        self.offset = np.asarray(offset, dtype=float)  # leg phase = cycle phase + offset
+        self.duty = duty            # stance fraction of the cycle
+        self.lift = lift            # fraction of the swing spent lifting (and lowering)
+        self.stride = stride        # foot travel either side of neutral, in commanded strides
+        self.profile = profile      # 'trapezoid' or 'sine' swing height
+        self.frames = frames        # frames per cycle at speed 2 and speed 10
+
+    def foot(self, phase):
+        "Position along the stride (+-stride) and lift (0..1) of every leg at this cycle phase"
+        theta = (phase + self.offset) % 1.0
+        a = self.stride
+        stance = theta < self.duty
+        s = np.where(stance, 0.0, (theta - self.duty) / (1 - self.duty))
+        if self.profile == 'sine':
+            x_swing = -a * np.cos(math.pi * s)
+            z = np.sin(math.pi * s)
+        else:
+            l = self.lift
+            x_swing = np.clip(-a + 2*a*(s - l)/(1 - 2*l), -a, a)
+            z = np.minimum(np.minimum(s / l, (1 - s) / l), 1.0)
+        x = np.where(stance, a - 2*a*theta/self.duty, x_swing)
+        z = np.where(stance, 0.0, z)
+        return x, z
+
+# Legs 1-3 are on one side (front, middle, back), legs 4-6 on the other (back, middle, front)
+GAITS = {
+    # Tripod: legs 1,3,5 and 2,4,6 alternate half a cycle apart
+    '1': GaitPattern([1/4, 3/4, 1/4, 3/4, 1/4, 3/4], duty=1/2, lift=1/4, stride=1.0, frames=(126, 22)),
+    # Wave: one leg at a time in the order 6,3,2,1,4,5
+    '2': GaitPattern([-4/6, -3/6, -2/6, -5/6, 0.0, -1/6], duty=5/6, lift=1/3, stride=5/6, frames=(171, 45)),
+    # Ripple: back-to-front wave on each side, the two sides half a cycle apart
+    '3': GaitPattern([0.0, 1/3, 2/3, 1/6, 5/6, 1/2], duty=2/3, lift=1/4, stride=1.0, frames=(150, 33)),
+}
+
+class GaitEngine:
+    ''' Streaming gait generator driven by a phase accumulator.
+
+    command() may be called every frame. A new stride is blended in over the
+    following frames instead of waiting for the running cycle to finish, and a
+    stop brings the feet down and back to neutral within a few frames.'''
+    def __init__(self, body_point, blend=2.0, lift_rate=0.1):
+        self.body_point = np.array(body_point, dtype=float)[:, :2]
+        self.blend = blend            # most stride change per frame (mm)
+        self.lift_rate = lift_rate    # most lift amplitude change per frame
+        self.reset()
+
+    def reset(self):
+        "Drop any motion in progress and stand at neutral"
+        self.gait = '1'
+        self.pending_gait = None
+        self.frames = 64              # frames per gait cycle (F)
+        self.frame = 0                # position in the cycle, phase = frame/frames
+        self.cycles = 0
+        self.Z = 40
+        self.height = -25
+        self.stride = np.zeros((6, 2))
+        self.target = np.zeros((6, 2))
+        self.lift = 0.0
+        self.target_lift = 0.0
+
+    def command(self, gait, x, y, angle, frames, Z=40, height=-25):
+        "Set the commanded move; x, y in mm per cycle, angle in degrees per cycle"
+        a = angle / 180 * math.pi
+        bx, by = self.body_point[:, 0], self.body_point[:, 1]
+        target = np.stack((bx*math.cos(a) + by*math.sin(a) - bx + x,
+                           -bx*math.sin(a) + by*math.cos(a) - by + y), axis=1)
+        if gait not in GAITS or (x == 0 and y == 0 and angle == 0):
+            target[:] = 0
+        if gait in GAITS and gait != self.gait:
+            if self.moving():
+                # Trajectories differ between gaits: come to rest, then switch
+                self.pending_gait = gait
+                target[:] = 0
+            else:
+                self.gait = gait
+        else:
+            self.pending_gait = None
+        if target.any() and frames != self.frames:
+            self.frame = round(self.frame * frames / self.frames) % frames
+            self.frames = frames
+        self.target = target
+        self.target_lift = 1.0 if target.any() else 0.0
+        self.Z = Z
+        self.height = height
+
+    def moving(self):
+        return bool(self.stride.any() or self.target.any() or self.lift or self.target_lift)
+
+    def steady(self):
+        "True when the stride has fully converged, so frames repeat every cycle"
+        return (self.pending_gait is None and self.target_lift == 1.0 and self.lift == 1.0
+                and np.array_equal(self.stride, self.target))
+
+    def points(self):
+        "Body-frame foot positions (6×3) for the current frame"
+        x, z = GAITS[self.gait].foot(self.frame / self.frames)
+        point = np.empty((6, 3))
+        point[:, :2] = self.body_point + self.stride * x[:, None]
+        point[:, 2] = self.height + self.Z * self.lift * z
+        return point
+
+    def cyclePoints(self, stride=None):
+        "Foot positions (F×6×3) for every frame of a full-stride cycle"
+        stride = self.target if stride is None else stride
+        phase = np.arange(self.frames)[:, None] / self.frames
+        x, z = GAITS[self.gait].foot(phase)
+        point = np.empty((self.frames, 6, 3))
+        point[..., :2] = self.body_point + stride * x[..., None]
+        point[..., 2] = self.height + self.Z * z
+        return point
+
+    def advance(self, ticks=1):
+        "Move on by ticks frames, blending stride and lift toward the command"
+        self.stride = self._toward(self.stride, self.target, self.blend * ticks)
+        self.lift = float(self._toward(self.lift, self.target_lift, self.lift_rate * ticks))
+        if not self.moving():
+            self.frame = 0
+            if self.pending_gait is not None:
+                self.gait = self.pending_gait
+                self.pending_gait = None
+            return
+        self.frame += ticks
+        if self.frame >= self.frames:
+            self.cycles += self.frame // self.frames
+            self.frame %= self.frames
+
+    def _toward(self, value, target, step):
+        # Lands exactly on target so steady() can compare for equality
+        diff = target - value
+        return np.where(np.abs(diff) <= step, target, value + np.sign(diff) * step)
+
+if __name__ == '__main__':
+    pass
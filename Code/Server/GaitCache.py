@@ -0,0 +1,60 @@
+#coding:utf-8
+import collections
+import numpy as np
+
+# One compiled gait cycle: per-frame servo duties (F×18, setLegServoDuty order)
+GaitCycle = collections.namedtuple('GaitCycle', ['frames'])
+
+class GaitCache:
+    ''' LRU cache of compiled gait cycles, bounded by memory budget'''
+    def __init__(self, max_bytes=1024*1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cycles = collections.OrderedDict()
+
+    def get(self, key):
+        cycle = self._cycles.get(key)
+        if cycle is None:
+            self.misses += 1
+            return None
+        self._cycles.move_to_end(key)
+        self.hits += 1
+        return cycle
+
+    def put(self, key, frames):
+        cycle = GaitCycle(np.array(frames, dtype=np.uint16))
+        size = self.sizeOf(cycle)
+        if size > self.max_bytes:
+            return None
+        if key in self._cycles:
+            self.bytes -= self.sizeOf(self._cycles.pop(key))
+        while self._cycles and self.bytes + size > self.max_bytes:
+            _, old = self._cycles.popitem(last=False)
+            self.bytes -= self.sizeOf(old)
+            self.evictions += 1
+        self._cycles[key] = cycle
+        self.bytes += size
+        return cycle
+
+    def sizeOf(self, cycle):
+        return cycle.frames.nbytes
+
+    def clear(self):
+        self._cycles.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._cycles),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+if __name__ == '__main__':
+    pass
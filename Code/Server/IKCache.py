@@ -0,0 +1,60 @@
+#coding:utf-8
+import collections
+import numpy as np
+
+class IKCache:
+    ''' Memo for the leg inverse kinematics, keyed on foot coordinates snapped
+    to a grid of `resolution` mm plus the link lengths.
+
+    A lookup returns exactly what the solver gives for the snapped point, so
+    results are identical to the uncached solver at that resolution.'''
+    def __init__(self, solve, resolution=1.0, max_entries=8192):
+        self.solve = solve              # batch solver, e.g. Control.coordinateToAngleBatch
+        self.resolution = resolution
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._angles = collections.OrderedDict()
+
+    def angles(self, ox, oy, oz, l1=33, l2=90, l3=110):
+        "N×3 joint angles for arrays of foot coordinates"
+        grid = np.rint(np.stack((ox, oy, oz), axis=-1) / self.resolution).astype(np.int64)
+        angle = np.empty(grid.shape, dtype=int)
+        keys = [(x, y, z, l1, l2, l3) for x, y, z in grid.tolist()]
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self._angles.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                self._angles.move_to_end(key)
+                angle[i] = cached
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            point = grid[missing] * self.resolution
+            solved = self.solve(point[:, 0], point[:, 1], point[:, 2], l1, l2, l3)
+            for i, value in zip(missing, solved):
+                angle[i] = value
+                self._angles[keys[i]] = value
+            while len(self._angles) > self.max_entries:
+                self._angles.popitem(last=False)
+                self.evictions += 1
+        return angle
+
+    def clear(self):
+        self._angles.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._angles),
+                'max_entries': self.max_entries,
+                'resolution': self.resolution,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+if __name__ == '__main__':
+    pass
@@ -2,129 +2,441 @@
 import time
 import math
 import os
+import json
+import struct
+import threading
+import numpy as np
 from Kalman import *
-from mpu6050 import mpu6050
+from Mahony import MahonyFilter
+from Bus import openBus
+from Scheduler import FrameScheduler
+from collections import namedtuple
+
+class MPU6050:
+    ''' MPU6050 driver on the pluggable bus, with the interface of the mpu6050 package'''
+    GRAVITIY_MS2 = 9.80665
+    ACCEL_RANGE_2G = 0x00
+    ACCEL_RANGE_4G = 0x08
+    ACCEL_RANGE_8G = 0x10
+    ACCEL_RANGE_16G = 0x18
+    GYRO_RANGE_250DEG = 0x00
+    GYRO_RANGE_500DEG = 0x08
+    GYRO_RANGE_1000DEG = 0x10
+    GYRO_RANGE_2000DEG = 0x18
+    ACCEL_SCALE = {0x00: 16384.0, 0x08: 8192.0, 0x10: 4096.0, 0x18: 2048.0}
+    GYRO_SCALE = {0x00: 131.0, 0x08: 65.5, 0x10: 32.8, 0x18: 16.4}
+    PWR_MGMT_1 = 0x6B
+    ACCEL_CONFIG = 0x1C
+    GYRO_CONFIG = 0x1B
+    ACCEL_XOUT0 = 0x3B
+    TEMP_OUT0 = 0x41
+    GYRO_XOUT0 = 0x43
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    FIFO_EN = 0x23
+    INT_STATUS = 0x3A
+    USER_CTRL = 0x6A
+    FIFO_COUNTH = 0x72
+    FIFO_R_W = 0x74
+    # ACCEL_XOUT_H..GYRO_ZOUT_L: accel x,y,z, temperature, gyro x,y,z (big-endian int16)
+    BURST = struct.Struct('>7h')
+    FIFO_SAMPLE = 12            # accel x,y,z then gyro x,y,z; temperature is left out
+    BLOCK = 32                  # most bytes per SMBus block read
+
+    def __init__(self, address=0x68, bus=None):
+        self.address = address
+        self.bus = bus if bus is not None else openBus(1, 'imu')
+        self.bus.write_byte_data(self.address, self.PWR_MGMT_1, 0x00)
+        # Counts per m/s^2 and per deg/s at the power-on ranges; kept in step by set_*_range
+        self._accel_scale = self.ACCEL_SCALE[self.ACCEL_RANGE_2G] / self.GRAVITIY_MS2
+        self._gyro_scale = self.GYRO_SCALE[self.GYRO_RANGE_250DEG]
+
+    def read_i2c_word(self, register):
+        high = self.bus.read_byte_data(self.address, register)
+        low = self.bus.read_byte_data(self.address, register + 1)
+        value = (high << 8) + low
+        return value - 0x10000 if value >= 0x8000 else value
+
+    def set_accel_range(self, accel_range):
+        self.bus.write_byte_data(self.address, self.ACCEL_CONFIG, 0x00)
+        self.bus.write_byte_data(self.address, self.ACCEL_CONFIG, accel_range)
+        self._accel_scale = self.ACCEL_SCALE[accel_range] / self.GRAVITIY_MS2
+
+    def set_gyro_range(self, gyro_range):
+        self.bus.write_byte_data(self.address, self.GYRO_CONFIG, 0x00)
+        self.bus.write_byte_data(self.address, self.GYRO_CONFIG, gyro_range)
+        self._gyro_scale = self.GYRO_SCALE[gyro_range]
+
+    def get_temp(self):
+        "Die temperature in degrees C"
+        return self.read_i2c_word(self.TEMP_OUT0) / 340.0 + 36.53
+
+    def get_accel_data(self, g=False):
+        x = self.read_i2c_word(self.ACCEL_XOUT0)
+        y = self.read_i2c_word(self.ACCEL_XOUT0 + 2)
+        z = self.read_i2c_word(self.ACCEL_XOUT0 + 4)
+        scale = self.ACCEL_SCALE[self.bus.read_byte_data(self.address, self.ACCEL_CONFIG) & 0x18]
+        if not g:
+            scale /= self.GRAVITIY_MS2
+        return {'x': x / scale, 'y': y / scale, 'z': z / scale}
+
+    def get_gyro_data(self):
+        x = self.read_i2c_word(self.GYRO_XOUT0)
+        y = self.read_i2c_word(self.GYRO_XOUT0 + 2)
+        z = self.read_i2c_word(self.GYRO_XOUT0 + 4)
+        scale = self.GYRO_SCALE[self.bus.read_byte_data(self.address, self.GYRO_CONFIG) & 0x18]
+        return {'x': x / scale, 'y': y / scale, 'z': z / scale}
+
+    def read_raw(self):
+        "Accel, temperature and gyro counts from one 14-byte burst read"
+        return self.BURST.unpack(bytes(self.bus.read_i2c_block_data(self.address, self.ACCEL_XOUT0, 14)))
+
+    def get_motion_data(self, out=None):
+        "Accel (m/s^2) and gyro (deg/s) x,y,z as a 6-element array, from one burst read"
+        if out is None:
+            out = np.empty(6)
+        raw = self.read_raw()
+        out[0:3] = raw[0:3]
+        out[3:6] = raw[4:7]
+        out[0:3] /= self._accel_scale
+        out[3:6] /= self._gyro_scale
+        return out
+
+    def enable_fifo(self, rate=500):
+        "Start sampling accel and gyro into the FIFO at rate Hz (1 kHz / n); returns the actual rate"
+        divider = max(0, min(255, int(round(1000.0 / rate)) - 1))
+        self.bus.write_byte_data(self.address, self.CONFIG, 0x01)          # DLPF 184 Hz: 1 kHz base rate
+        self.bus.write_byte_data(self.address, self.SMPLRT_DIV, divider)
+        self.bus.write_byte_data(self.address, self.FIFO_EN, 0x78)         # XG, YG, ZG, ACCEL
+        self.bus.write_byte_data(self.address, self.USER_CTRL, 0x04)       # FIFO_RESET
+        self.bus.write_byte_data(self.address, self.USER_CTRL, 0x40)       # FIFO_EN
+        self.fifo_rate = 1000.0 / (1 + divider)
+        return self.fifo_rate
+
+    def disable_fifo(self):
+        self.bus.write_byte_data(self.address, self.USER_CTRL, 0x00)
+        self.bus.write_byte_data(self.address, self.FIFO_EN, 0x00)
+
+    def read_fifo(self):
+        """Drain the FIFO: an N×6 array of accel (m/s^2) and gyro (deg/s) samples, oldest first.
+        After an overflow the FIFO is reset and nothing is returned, since its framing is lost."""
+        status, _ = self.bus.read_i2c_block_data(self.address, self.INT_STATUS, 2)
+        high, low = self.bus.read_i2c_block_data(self.address, self.FIFO_COUNTH, 2)
+        if status & 0x10:
+            self.bus.write_byte_data(self.address, self.USER_CTRL, 0x44)   # FIFO_EN | FIFO_RESET
+            return np.empty((0, 6))
+        remaining = ((high << 8) | low) // self.FIFO_SAMPLE * self.FIFO_SAMPLE
+        data = bytearray()
+        while remaining:
+            length = min(self.BLOCK, remaining)
+            data += bytes(self.bus.read_i2c_block_data(self.address, self.FIFO_R_W, length))
+            remaining -= length
+        samples = np.frombuffer(bytes(data), dtype='>i2').reshape(-1, 6).astype(float)
+        samples[:, 0:3] /= self._accel_scale
+        samples[:, 3:6] /= self._gyro_scale
+        return samples
+
+class Welford:
+    "Streaming per-channel mean and variance; add() merges whole blocks of samples"
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = np.zeros(self.size)
+        self.m2 = np.zeros(self.size)
+
+    def add(self, samples):
+        samples = np.atleast_2d(samples)
+        n = len(samples)
+        if not n:
+            return
+        mean = samples.mean(axis=0)
+        m2 = ((samples - mean) ** 2).sum(axis=0)
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros(self.size)
+
+class BiasCalibrator:
+    ''' Estimates the sensor bias in the background while the robot stands still and level.
+
+    Samples are read in short windows. A window is merged into a running
+    Welford estimate when the level pose was commanded throughout
+    (setLevel), the gyro and accel spread is below the stillness limits
+    and the mean accel points within MAX_TILT of +z; any other window
+    starts it over, so a tilted, sloped or limp robot never ends up in the
+    bias. Once SAMPLES samples are in, the mean is offered to the IMU,
+    which keeps (and saves) it only if it differs from the current bias,
+    and the next estimate starts after `interval` seconds. pause() stops
+    the sampling, e.g. while balance mode owns the FIFO.'''
+    WINDOW = 25             # samples per stillness check
+    SAMPLES = 250           # still samples per estimate
+    STILL_GYRO = 1.0        # deg/s, largest per-axis standard deviation of a still window
+    STILL_ACCEL = 0.2       # m/s^2
+    MAX_TILT = 5.0          # degrees between the mean accel and +z
+
+    def __init__(self, imu, rate=50, interval=60):
+        self.imu = imu
+        self.period = 1.0 / rate
+        self.interval = interval
+        self.stats = Welford(6)
+        self.estimates = 0
+        self.level = False      # until a level standing pose is commanded
+        self._epoch = 0         # bumped on every setLevel, so windows spanning a pose change are dropped
+        self._run = threading.Event()
+        self._run.set()
+        self._reading = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def setLevel(self, level):
+        "Tell the estimator whether the commanded body pose is the level standing one"
+        self.level = level
+        self._epoch += 1
+
+    def pause(self):
+        "Stop sampling; returns once no read is in flight"
+        self._run.clear()
+        with self._reading:
+            pass
+
+    def resume(self):
+        self._run.set()
+
+    def _loop(self):
+        window = np.empty((self.WINDOW, 6))
+        while True:
+            self._run.wait()
+            epoch = self._epoch
+            try:
+                for row in window:
+                    with self._reading:
+                        if not self._run.is_set():
+                            break
+                        self.imu.sensor.get_motion_data(row)
+                    time.sleep(self.period)
+            except OSError as e:
+                print(e)
+                time.sleep(1)
+                continue
+            if not self._run.is_set() or not self.level or self._epoch != epoch:
+                # Paused, not level, or the pose changed mid-window
+                self.stats.reset()
+                continue
+            spread = window.std(axis=0)
+            accel = window[:, 0:3].mean(axis=0)
+            tilt = math.degrees(math.acos(max(-1.0, min(1.0, accel[2] / max(np.linalg.norm(accel), 1e-9)))))
+            if (spread[3:6] < self.STILL_GYRO).all() and (spread[0:3] < self.STILL_ACCEL).all() and tilt <= self.MAX_TILT:
+                self.stats.add(window)
+            else:
+                self.stats.reset()
+            if self.stats.n >= self.SAMPLES:
+                mean = self.stats.mean
+                self.imu.updateBias({'x': mean[0], 'y': mean[1], 'z': mean[2] - 9.8},
+                                    {'x': mean[3], 'y': mean[4], 'z': mean[5]})
+                self.estimates += 1
+                self.stats.reset()
+                time.sleep(self.interval)
+
 class IMU:
-    def __init__(self):
-        self.Kp = 100 
-        self.Ki = 0.002 
-        self.halfT = 0.001 
-
-        self.q0 = 1
-        self.q1 = 0
-        self.q2 = 0
-        self.q3 = 0
-
-        self.exInt = 0
-        self.eyInt = 0
-        self.ezInt = 0
+    MAX_DT = 0.1            # longest gap (s) integrated as-is; after an idle pause the step is capped
+    BIAS_FILE = 'imu_bias.json'
+    BIAS_MAX_AGE = 7*24*3600    # s before a stored bias is no longer trusted
+    BIAS_MAX_DRIFT = 5.0        # degrees C of temperature change a stored bias tolerates
+    BIAS_ACCEL_STEP = 0.05      # m/s^2 change before a new background estimate replaces the bias
+    BIAS_GYRO_STEP = 0.1        # deg/s
+
+    def __init__(self,bias_file=BIAS_FILE):
+        self.mahony = MahonyFilter()
+        self._last = None
         self.pitch = 0
         self.roll =0
         self.yaw = 0
+        self.motion = (0.0,)*6      # latest bias-corrected accel/gyro sample, before smoothing
         
-        self.sensor = mpu6050(address=0x68,bus=1) 
-        self.sensor.set_accel_range(mpu6050.ACCEL_RANGE_2G)   
-        self.sensor.set_gyro_range(mpu6050.GYRO_RANGE_250DEG)  
+        self.sensor = MPU6050(address=0x68) 
+        self.sensor.set_accel_range(MPU6050.ACCEL_RANGE_2G)   
+        self.sensor.set_gyro_range(MPU6050.GYRO_RANGE_250DEG)  
         
-        self.kalman_filter_AX =  Kalman_filter(0.001,0.1)
-        self.kalman_filter_AY =  Kalman_filter(0.001,0.1)
-        self.kalman_filter_AZ =  Kalman_filter(0.001,0.1)
-
-        self.kalman_filter_GX =  Kalman_filter(0.001,0.1)
-        self.kalman_filter_GY =  Kalman_filter(0.001,0.1)
-        self.kalman_filter_GZ =  Kalman_filter(0.001,0.1)
+        # One filter bank for accel x,y,z and gyro x,y,z
+        self.kalman = KalmanBank(0.001,0.1,6)
         
-        self.Error_value_accel_data,self.Error_value_gyro_data=self.average_filter()
+        self._sample = np.empty(6)
+        # Bias from the last estimate on disk; zero until the background estimate
+        # lands if there is none (balance mode calibrates on entry when it needs to)
+        self.bias_file=bias_file
+        self.bias_time=None
+        self.bias_temp=None
+        self.Error_value_accel_data={'x':0.0,'y':0.0,'z':0.0}
+        self.Error_value_gyro_data={'x':0.0,'y':0.0,'z':0.0}
+        self.loadBias()
+        self.calibrator=BiasCalibrator(self)
     
     def average_filter(self):
-        sum_accel_x=0
-        sum_accel_y=0
-        sum_accel_z=0
-        
-        sum_gyro_x=0
-        sum_gyro_y=0
-        sum_gyro_z=0
-        
+        total=np.zeros(6)
         for i in range(100):
-            accel_data = self.sensor.get_accel_data()   
-            gyro_data = self.sensor.get_gyro_data()      
-            
-            sum_accel_x+=accel_data['x']
-            sum_accel_y+=accel_data['y']
-            sum_accel_z+=accel_data['z']
-            
-            sum_gyro_x+=gyro_data['x']
-            sum_gyro_y+=gyro_data['y']
-            sum_gyro_z+=gyro_data['z']
-            
-        sum_accel_x/=100
-        sum_accel_y/=100
-        sum_accel_z/=100
-        
-        sum_gyro_x/=100
-        sum_gyro_y/=100
-        sum_gyro_z/=100
-        
-        accel_data['x']=sum_accel_x
-        accel_data['y']=sum_accel_y
-        accel_data['z']=sum_accel_z-9.8
-        
-        gyro_data['x']=sum_gyro_x
-        gyro_data['y']=sum_gyro_y
-        gyro_data['z']=sum_gyro_z
+            total+=self.sensor.get_motion_data(self._sample)
+        total/=100
+        accel_data={'x':total[0],'y':total[1],'z':total[2]-9.8}
+        gyro_data={'x':total[3],'y':total[4],'z':total[5]}
         return accel_data,gyro_data
+    def calibrate(self):
+        "Foreground bias estimate from a 100-sample average, for when no usable one exists"
+        self.setBias(*self.average_filter())
+    def setBias(self,accel_data,gyro_data,save=True):
+        "Use a new bias estimate (the dicts average_filter returns) and persist it"
+        self.Error_value_accel_data,self.Error_value_gyro_data=accel_data,gyro_data
+        self.bias_temp=self.sensor.get_temp()
+        self.bias_time=time.time()
+        if save:
+            self.saveBias()
+    def updateBias(self,accel_data,gyro_data):
+        "Take a background estimate only if it moved, or the current bias is stale or half its age limit; True if taken"
+        moved=(max(abs(accel_data[k]-self.Error_value_accel_data[k]) for k in 'xyz')>self.BIAS_ACCEL_STEP or
+               max(abs(gyro_data[k]-self.Error_value_gyro_data[k]) for k in 'xyz')>self.BIAS_GYRO_STEP)
+        if not (moved or self.staleBias() or time.time()-self.bias_time>self.BIAS_MAX_AGE/2):
+            return False
+        self.setBias(accel_data,gyro_data)
+        return True
+    def saveBias(self):
+        data={'accel':{k:float(v) for k,v in self.Error_value_accel_data.items()},
+              'gyro':{k:float(v) for k,v in self.Error_value_gyro_data.items()},
+              'temperature':self.bias_temp,
+              'timestamp':self.bias_time}
+        try:
+            with open(self.bias_file+'.tmp','w') as f:
+                json.dump(data,f,indent=2)
+            os.replace(self.bias_file+'.tmp',self.bias_file)
+        except OSError as e:
+            print(e)
+    def loadBias(self):
+        "Take the stored bias if there is one that is not stale; True when it was used"
+        try:
+            with open(self.bias_file) as f:
+                data=json.load(f)
+            accel,gyro=data['accel'],data['gyro']
+            temp,stamp=float(data['temperature']),float(data['timestamp'])
+        except (OSError,ValueError,KeyError,TypeError):
+            return False
+        if self.staleBias(temp,stamp):
+            return False
+        self.Error_value_accel_data,self.Error_value_gyro_data=accel,gyro
+        self.bias_temp,self.bias_time=temp,stamp
+        return True
+    def staleBias(self,temp=None,stamp=None):
+        "True when the bias (the current one by default) is missing, too old or from another temperature"
+        if stamp is None:
+            temp,stamp=self.bias_temp,self.bias_time
+        if stamp is None:
+            return True
+        if time.time()-stamp>self.BIAS_MAX_AGE:
+            return True
+        return abs(self.sensor.get_temp()-temp)>self.BIAS_MAX_DRIFT
+    def interval(self):
+        "Seconds since the previous live sample, from the monotonic clock (0 for the first one)"
+        now=time.monotonic()
+        dt=0.0 if self._last is None else min(now-self._last,self.MAX_DT)
+        self._last=now
+        return dt
     def imuUpdate(self):
-        accel_data = self.sensor.get_accel_data()    
-         
-        gyro_data = self.sensor.get_gyro_data() 
-        ax=self.kalman_filter_AX.kalman(accel_data['x']-self.Error_value_accel_data['x'])
-        ay=self.kalman_filter_AY.kalman(accel_data['y']-self.Error_value_accel_data['y'])
-        az=self.kalman_filter_AZ.kalman(accel_data['z']-self.Error_value_accel_data['z'])
-        gx=self.kalman_filter_GX.kalman(gyro_data['x']-self.Error_value_gyro_data['x'])
-        gy=self.kalman_filter_GY.kalman(gyro_data['y']-self.Error_value_gyro_data['y'])
-        gz=self.kalman_filter_GZ.kalman(gyro_data['z']-self.Error_value_gyro_data['z'])
-
-        norm = math.sqrt(ax*ax+ay*ay+az*az)
-        
-        ax = ax/norm
-        ay = ay/norm
-        az = az/norm
-        
-        vx = 2*(self.q1*self.q3 - self.q0*self.q2)
-        vy = 2*(self.q0*self.q1 + self.q2*self.q3)
-        vz = self.q0*self.q0 - self.q1*self.q1 - self.q2*self.q2 + self.q3*self.q3
-        
-        ex = (ay*vz - az*vy)
-        ey = (az*vx - ax*vz)
-        ez = (ax*vy - ay*vx)
-        
-        self.exInt += ex*self.Ki
-        self.eyInt += ey*self.Ki
-        self.ezInt += ez*self.Ki
-        
-        gx += self.Kp*ex + self.exInt
-        gy += self.Kp*ey + self.eyInt
-        gz += self.Kp*ez + self.ezInt
-        
-        self.q0 += (-self.q1*gx - self.q2*gy - self.q3*gz)*self.halfT
-        self.q1 += (self.q0*gx + self.q2*gz - self.q3*gy)*self.halfT
-        self.q2 += (self.q0*gy - self.q1*gz + self.q3*gx)*self.halfT
-        self.q3 += (self.q0*gz + self.q1*gy - self.q2*gx)*self.halfT
-        
-        norm = math.sqrt(self.q0*self.q0 + self.q1*self.q1 + self.q2*self.q2 + self.q3*self.q3)
-        self.q0 /= norm
-        self.q1 /= norm
-        self.q2 /= norm
-        self.q3 /= norm
-        
-        pitch = math.asin(-2*self.q1*self.q3+2*self.q0*self.q2)*57.3
-        roll = math.atan2(2*self.q2*self.q3+2*self.q0*self.q1,-2*self.q1*self.q1-2*self.q2*self.q2+1)*57.3
-        yaw = math.atan2(2*(self.q1*self.q2 + self.q0*self.q3),self.q0*self.q0+self.q1*self.q1-self.q2*self.q2-self.q3*self.q3)*57.3
-        self.pitch = pitch
-        self.roll =roll
-        self.yaw = yaw
+        # One burst read per sample instead of 14 register reads
+        ax,ay,az,gx,gy,gz=self.sensor.get_motion_data(self._sample).tolist()
+        return self.fuse(ax,ay,az,gx,gy,gz,self.interval())
+    def startFifo(self,rate=500):
+        "Sample into the MPU6050 FIFO at rate Hz; read the samples with imuUpdateFifo()"
+        self.calibrator.pause()
+        self.fifo_rate=self.sensor.enable_fifo(rate)
+        return self.fifo_rate
+    def stopFifo(self):
+        self.sensor.disable_fifo()
+        self.calibrator.resume()
+    def imuUpdateFifo(self):
+        "Drain the FIFO and run every sample through the filter; returns the latest attitude"
+        samples=self.sensor.read_fifo()
+        samples-=[self.Error_value_accel_data['x'],self.Error_value_accel_data['y'],self.Error_value_accel_data['z'],
+                  self.Error_value_gyro_data['x'],self.Error_value_gyro_data['y'],self.Error_value_gyro_data['z']]
+        if len(samples):
+            self.motion=tuple(samples[-1].tolist())
+        samples=self.kalman.filter(samples)
+        # FIFO samples are spaced by the sensor's own sample clock
+        if len(samples):
+            self.pitch,self.roll,self.yaw=self.mahony.updateBatch(samples[:,0:3],samples[:,3:6],1.0/self.fifo_rate)
+        return self.pitch,self.roll,self.yaw
+    def fuse(self,ax,ay,az,gx,gy,gz,dt,bias=True):
+        "Kalman-smooth one accel (m/s^2) / gyro (deg/s) sample and advance the attitude by dt seconds"
+        if bias:
+            ax-=self.Error_value_accel_data['x']
+            ay-=self.Error_value_accel_data['y']
+            az-=self.Error_value_accel_data['z']
+            gx-=self.Error_value_gyro_data['x']
+            gy-=self.Error_value_gyro_data['y']
+            gz-=self.Error_value_gyro_data['z']
+        self.motion=(ax,ay,az,gx,gy,gz)
+        ax,ay,az,gx,gy,gz=self.kalman.kalman((ax,ay,az,gx,gy,gz)).tolist()
+        self.pitch,self.roll,self.yaw=self.mahony.update(ax,ay,az,gx,gy,gz,dt)
         return self.pitch,self.roll,self.yaw
 
+# One published IMU update: attitude in degrees, motion as accel (m/s^2) and gyro (deg/s) x,y,z
+IMUSample = namedtuple('IMUSample', ['seq', 'time', 'pitch', 'roll', 'yaw', 'motion'])
+
+class IMUPublisher:
+    ''' Samples the IMU on its own thread and publishes the latest result.
+
+    The thread is the only writer. Each update is a new immutable
+    IMUSample stored with a single reference assignment, so readers never
+    block and never see half of one. A reader compares seq with the last
+    one it used to tell a new sample from a repeat, and any number of
+    readers (balance loop, telemetry, logging) can share the stream.'''
+    def __init__(self, imu, rate=100, fifo_rate=500):
+        self.imu = imu
+        self.fifo_rate = fifo_rate
+        self.scheduler = FrameScheduler(1.0 / rate, FrameScheduler.DROP)
+        self.sample = None
+        self.error = None
+        self._run = threading.Event()
+        self._thread = None
+
+    def start(self):
+        "Start sampling through the FIFO; a no-op while already running"
+        if self._thread is not None:
+            return
+        self.sample = None
+        self.imu.startFifo(self.fifo_rate)
+        self._run.set()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._run.clear()
+        self._thread.join()
+        self._thread = None
+        self.imu.stopFifo()
+
+    def latest(self):
+        "The newest IMUSample, or None before the first one"
+        return self.sample
+
+    def _loop(self):
+        seq = 0
+        self.scheduler.start()
+        while self._run.is_set():
+            try:
+                pitch, roll, yaw = self.imu.imuUpdateFifo()
+            except OSError as e:
+                self.error = e
+            else:
+                seq += 1
+                self.sample = IMUSample(seq, time.monotonic(), pitch, roll, yaw, self.imu.motion)
+            self.scheduler.wait()
+
 # Main program logic follows:
 if __name__ == '__main__':
     s=IMU()
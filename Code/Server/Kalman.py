@@ -25,3 +25,84 @@ class Kalman_filter:
         self.P_k_k1 = self.P_k1_k1
         self.kalman_adc_old = kalman_adc
         return kalman_adc
+
+import numpy as np
+
+class KalmanBank:
+    ''' Kalman_filter for N channels at once.
+
+    kalman() takes one sample per channel and matches Kalman_filter
+    bit for bit, including the 0.4/0.6 blend when a sample is 60 or
+    more away from the last estimate. filter() runs a whole T×N signal
+    through the same recursion. Between blends the recursion is linear,
+    x[k] = (1-Kg[k])*x[k-1] + Kg[k]*z[k], so filter() solves it a chunk
+    at a time with cumulative products and only steps on its own at the
+    samples that trigger the blend. It agrees with kalman() to rounding.'''
+    BLEND = 60
+    MIN_GAIN = 1e-6     # shortest running product of (1-Kg) solved in one chunk
+
+    def __init__(self, Q, R, channels=1):
+        self.Q = Q
+        self.R = R
+        self.channels = channels
+        self.P = 1.0                        # error covariance; the same for every channel
+        self.x = np.zeros(channels)         # last estimate per channel (kalman_adc_old)
+
+    def gains(self, steps):
+        "Kalman gains for the next `steps` samples; advances P"
+        Kg = np.empty(steps)
+        P = self.P
+        for k in range(steps):
+            P_k_k1 = P + self.Q
+            Kg[k] = P_k_k1 / (P_k_k1 + self.R)
+            P_next = (1 - Kg[k]) * P_k_k1
+            if P_next == P:
+                # Converged: every later gain is the same
+                Kg[k:] = Kg[k]
+                break
+            P = P_next
+        self.P = P
+        return Kg
+
+    def kalman(self, values):
+        z = np.asarray(values, dtype=float)
+        old = self.x
+        Kg = self.gains(1)[0]
+        predict = np.where(np.abs(old - z) >= self.BLEND, z * 0.400 + old * 0.600, old)
+        self.x = predict + Kg * (z - old)
+        return self.x.copy()
+
+    def filter(self, signal):
+        "Filter a T×N signal (T samples of every channel); returns the T×N estimates"
+        z = np.asarray(signal, dtype=float).reshape(-1, self.channels)
+        out = np.empty_like(z)
+        Kg = self.gains(len(z))
+        a = 1 - Kg
+        for c in range(self.channels):
+            x = self.x[c]
+            zc = z[:, c]
+            k = 0
+            while k < len(zc):
+                if abs(x - zc[k]) >= self.BLEND:
+                    # Blend step, as in Kalman_filter.kalman
+                    x = (zc[k] * 0.400 + x * 0.600) + Kg[k] * (zc[k] - x)
+                    out[k, c] = x
+                    k += 1
+                    continue
+                # Linear stretch: x[k+i] = A[i]*(x + sum(u[j]/A[j] for j <= i))
+                A = np.cumprod(a[k:k + 256])
+                end = max(1, int(np.count_nonzero(A >= self.MIN_GAIN)))
+                A = A[:end]
+                u = Kg[k:k + end] * zc[k:k + end]
+                run = A * (x + np.cumsum(u / A))
+                # Keep it up to the first sample whose previous estimate calls for a blend
+                previous = np.concatenate(([x], run[:-1]))
+                blend = np.flatnonzero(np.abs(previous - zc[k:k + end]) >= self.BLEND)
+                if len(blend):
+                    end = blend[0]
+                out[k:k + end, c] = run[:end]
+                if end:
+                    x = run[end - 1]
+                k += end
+            self.x[c] = x
+        return out
@@ -0,0 +1,81 @@
+#coding:utf-8
+import math
+import numpy as np
+
+class MahonyFilter:
+    ''' Mahony attitude filter driven by the measured interval of each sample.
+
+    Gyro rates are in deg/s, accelerations in any unit. The gains are per
+    second, so the response does not change with the sample rate: Kp pulls
+    the attitude toward the measured gravity direction with a time constant
+    of 1/Kp seconds and Ki slowly trims gyro bias.
+
+    update() is the per-sample path for live polling. updateBatch() takes
+    whole arrays (a FIFO drain or a log replay): normalisation and unit
+    conversion run over the batch in numpy, and only the quaternion
+    recursion itself, which depends on the previous sample, runs per sample.'''
+    def __init__(self, Kp=10.0, Ki=0.01):
+        self.Kp = Kp
+        self.Ki = Ki
+        self.reset()
+
+    def reset(self):
+        self.q = [1.0, 0.0, 0.0, 0.0]
+        self.integral = [0.0, 0.0, 0.0]
+
+    def update(self, ax, ay, az, gx, gy, gz, dt):
+        "One sample taken dt seconds after the previous one"
+        norm = math.sqrt(ax*ax + ay*ay + az*az)
+        if norm == 0:
+            norm = 1.0
+        k = math.pi / 180
+        self._step(ax/norm, ay/norm, az/norm, gx*k, gy*k, gz*k, dt)
+        return self.attitude()
+
+    def updateBatch(self, accel, gyro, dt):
+        "N×3 accel and gyro samples with a scalar or per-sample dt; returns the final attitude"
+        accel = np.asarray(accel, dtype=float)
+        norm = np.sqrt((accel * accel).sum(axis=1, keepdims=True))
+        norm[norm == 0] = 1.0
+        accel = accel / norm
+        gyro = np.radians(np.asarray(gyro, dtype=float))
+        dt = np.broadcast_to(np.asarray(dt, dtype=float), (len(accel),))
+        step = self._step
+        for (ax, ay, az), (gx, gy, gz), t in zip(accel.tolist(), gyro.tolist(), dt.tolist()):
+            step(ax, ay, az, gx, gy, gz, t)
+        return self.attitude()
+
+    def _step(self, ax, ay, az, gx, gy, gz, dt):
+        q0, q1, q2, q3 = self.q
+        # Gravity direction predicted by the current attitude
+        vx = 2*(q1*q3 - q0*q2)
+        vy = 2*(q0*q1 + q2*q3)
+        vz = q0*q0 - q1*q1 - q2*q2 + q3*q3
+        ex = ay*vz - az*vy
+        ey = az*vx - ax*vz
+        ez = ax*vy - ay*vx
+        i = self.integral
+        i[0] += ex*self.Ki*dt
+        i[1] += ey*self.Ki*dt
+        i[2] += ez*self.Ki*dt
+        gx += self.Kp*ex + i[0]
+        gy += self.Kp*ey + i[1]
+        gz += self.Kp*ez + i[2]
+        h = 0.5*dt
+        q0, q1, q2, q3 = (q0 + (-q1*gx - q2*gy - q3*gz)*h,
+                          q1 + (q0*gx + q2*gz - q3*gy)*h,
+                          q2 + (q0*gy - q1*gz + q3*gx)*h,
+                          q3 + (q0*gz + q1*gy - q2*gx)*h)
+        norm = math.sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+        self.q = [q0/norm, q1/norm, q2/norm, q3/norm]
+
+    def attitude(self):
+        "(pitch, roll, yaw) in degrees"
+        q0, q1, q2, q3 = self.q
+        pitch = math.degrees(math.asin(max(-1.0, min(1.0, -2*q1*q3 + 2*q0*q2))))
+        roll = math.degrees(math.atan2(2*q2*q3 + 2*q0*q1, -2*q1*q1 - 2*q2*q2 + 1))
+        yaw = math.degrees(math.atan2(2*(q1*q2 + q0*q3), q0*q0 + q1*q1 - q2*q2 - q3*q3))
+        return pitch, roll, yaw
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,61 @@
+#coding:utf-8
+import time
+import threading
+import collections
+from Command import COMMAND as cmd
+
+class CommandMailbox:
+    ''' Hands orders from the network thread to the control thread.
+
+    Motion orders are latest-wins: posting one drops any motion order still
+    waiting, so a burst of joystick updates never queues up behind the gait.
+    Other orders are delivered in arrival order. Every post also re-arms the
+    idle relax deadline.'''
+    MOTION = (cmd.CMD_MOVE, cmd.CMD_POSITION, cmd.CMD_ATTITUDE, cmd.CMD_BALANCE)
+
+    def __init__(self, relax_after=10):
+        self.relax_after = relax_after
+        self.relax_deadline = None
+        self.dropped = 0
+        self._orders = collections.deque()
+        self._ready = threading.Condition()
+
+    def post(self, order):
+        with self._ready:
+            if order[0] in self.MOTION:
+                stale = [o for o in self._orders if o[0] in self.MOTION]
+                for o in stale:
+                    self._orders.remove(o)
+                self.dropped += len(stale)
+            self._orders.append(order)
+            self.relax_deadline = time.monotonic() + self.relax_after
+            self._ready.notify()
+
+    def wait(self):
+        "Block until an order arrives; returns None instead once the relax deadline passes"
+        with self._ready:
+            while not self._orders:
+                if self.relax_deadline is None:
+                    self._ready.wait()
+                    continue
+                remaining = self.relax_deadline - time.monotonic()
+                if remaining <= 0:
+                    self.relax_deadline = None
+                    return None
+                self._ready.wait(remaining)
+            return self._orders.popleft()
+
+    def poll(self):
+        "Next order without blocking, or None"
+        with self._ready:
+            return self._orders.popleft() if self._orders else None
+
+    def pending(self):
+        return len(self._orders) > 0
+
+    def cancelRelax(self):
+        with self._ready:
+            self.relax_deadline = None
+
+if __name__ == '__main__':
+    pass
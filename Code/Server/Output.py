@@ -0,0 +1,134 @@
+#coding:utf-8
+import math
+import threading
+import numpy as np
+
+class ServoOutput:
+    ''' Double-buffered leg servo output with per-servo slew limiting.
+
+    The control thread submits duty frames; a writer thread puts them on the
+    bus and then waits out the frame period on the scheduler. While frame N
+    is on the bus the next one is already being computed, and a submit only
+    blocks when a frame is still waiting to be written.
+
+    Frames submitted with slew=True are approached at no more than the
+    per-servo rate set by setRate(): the writer keeps stepping all 18
+    servos toward the target on every frame slot until it is reached, so a
+    large pose change becomes a ramp instead of a jump.
+
+    Limp servos have no known position to ramp from. After release() the
+    next frame powers them in groups of legs, `stagger` seconds apart,
+    with the rest held full off, so they do not all draw current at once.'''
+    GROUPS = ((0, 3), (1, 4), (2, 5))      # legs powered together when waking
+    FULL_OFF = 4096                         # PCA9685 OFF value with the full-off bit
+
+    def __init__(self, servo, scheduler, stagger=0.1):
+        self.servo = servo
+        self.scheduler = scheduler      # paces the writes; period 0 runs unpaced
+        self.frames = 0
+        self.error = None
+        self.current = None             # duty last written (float, mid-ramp values kept exact)
+        self._limit = None              # duty counts per second per servo
+        self._target = None
+        self._slew = False
+        self._ramping = False
+        self._pending = None            # back buffer: next (frame, slew) to write
+        self._busy = False              # front buffer is on the bus
+        self._skipped = 0               # slots the scheduler dropped, not yet reported
+        self._ticks = 1
+        self.stagger = stagger
+        self._groups = [servo.legMask(legs) for legs in self.GROUPS]
+        self._waking = 0                # groups powered so far after release(), None when awake (limp at power-on)
+        self._wake_wait = 0             # frame slots until the next group
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def setRate(self, limit):
+        "Per-servo slew limit in duty counts/s (scalar or 18 values in setLegServoDuty order); None for none"
+        with self._ready:
+            self._limit = None if limit is None else np.broadcast_to(np.asarray(limit, dtype=float), (18,)).copy()
+
+    def submit(self, duty, slew=False):
+        "Queue a leg duty frame (setLegServoDuty order) for the next frame slot"
+        with self._ready:
+            while self._pending is not None:
+                self._ready.wait()
+            if self.error is not None:
+                error, self.error = self.error, None
+                raise error
+            self._pending = (duty, slew)
+            self._ready.notify_all()
+
+    def ticks(self):
+        "Frame slots the writer moved on since the last call (more than 1 when slots were dropped)"
+        with self._ready:
+            skipped, self._skipped = self._skipped, 0
+        return 1 + skipped
+
+    def flush(self):
+        "Wait until every submitted frame is on the bus and any ramp has finished"
+        with self._ready:
+            while self._pending is not None or self._busy or self._ramping:
+                self._ready.wait()
+
+    def release(self):
+        "The servos were turned off: drop the queued frame and wake them in groups on the next one"
+        with self._ready:
+            self._pending = None
+            self._target = None
+            self._ramping = False
+            while self._busy:
+                self._ready.wait()
+            self.current = None
+            self._waking = 0
+            self._wake_wait = 0
+            self._ready.notify_all()
+
+    def _write(self):
+        while True:
+            with self._ready:
+                while self._pending is None and not self._ramping:
+                    self._ready.wait()
+                if self._pending is not None:
+                    (self._target, self._slew), self._pending = self._pending, None
+                target, limit = self._target, self._limit
+                self._busy = True
+                self._ready.notify_all()
+            period = self.scheduler.period
+            if self._waking is not None:
+                if self._wake_wait <= 0:
+                    self._waking += 1
+                    self._wake_wait = math.ceil(self.stagger / period) if period else 1
+                self._wake_wait -= self._ticks
+                powered = np.any(self._groups[:self._waking], axis=0)
+                duty = np.where(powered, target, self.FULL_OFF)
+                if self._waking < len(self._groups):
+                    out = None          # position still not known for the rest
+                else:
+                    self._waking = None
+                    out = target
+            elif self._slew and limit is not None and period and self.current is not None:
+                # All 18 servos step toward the target by at most their limit
+                step = limit * (period * self._ticks)
+                out = self.current + np.clip(target - self.current, -step, step)
+                duty = np.rint(out).astype(np.uint16)
+            else:
+                out = duty = target
+            try:
+                self.servo.setLegServoDuty(duty)
+            except Exception as e:
+                self.error = e
+            self.current = None if out is None else np.asarray(out, dtype=float)
+            with self._ready:
+                if self._target is target:      # not cancelled or replaced meanwhile
+                    self._ramping = not np.array_equal(self.current, target)
+                self._busy = False
+                self.frames += 1
+                self._ready.notify_all()
+            self._ticks = self.scheduler.wait()
+            with self._ready:
+                self._skipped += self._ticks - 1
+
+if __name__ == '__main__':
+    pass
@@ -2,7 +2,7 @@
 
 import time
 import math
-import smbus
+from Bus import openBus
 
 # ============================================================================
 # Raspi PCA9685 16-Channel PWM Servo Driver
@@ -25,10 +25,15 @@ class PCA9685:
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
 
-  def __init__(self, address=0x40, debug=False):
-    self.bus = smbus.SMBus(1)
+  def __init__(self, address=0x40, debug=False, bus=None):
+    self.bus = bus if bus is not None else openBus(1, 'servo')
     self.address = address
     self.debug = debug
+    # Shadow copy of the LED ON/OFF counts last written; None = unknown
+    self.invalidate()
+    self.bytes_written = 0
+    self.bytes_saved = 0
+    self.blocks_written = 0
     self.write(self.__MODE1, 0x20)  # 0x20 = AI (auto-increment) bit set; required for block writes
     
   def write(self, reg, value):
@@ -63,19 +68,69 @@ class PCA9685:
     self.write(self.__LED0_ON_H+4*channel, on >> 8)
     self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
     self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+    self._on[channel] = on
+    self._off[channel] = off
 
   def setChannelsPWM(self, start_channel, duty_list):
-    "Write duty values for consecutive channels in one I2C block write (18x fewer transactions)"
+    "Write duty values for consecutive channels, sending only the channels that changed"
+    duty_list = [int(d) for d in duty_list]
+    blocks = []
+    for channel, d in enumerate(duty_list, start_channel):
+      if self._off[channel] == d and self._on[channel] == 0:
+        continue
+      last = blocks[-1] if blocks else None
+      # Limit to 16 bytes per call to stay within the RPi BCM2835 I2C TX FIFO size.
+      # Larger chunks require a mid-transaction FIFO refill which can corrupt the
+      # PWM registers with a partial OFF_L/OFF_H state, causing servo jitter.
+      if last is not None and last[0] == channel - 1 and len(last[2]) <= 12:
+        last[2].extend([0x00, 0x00, d & 0xFF, d >> 8])
+        last[0] = channel
+      elif last is not None and last[0] == channel - 2 and len(last[2]) <= 8:
+        # Resending one unchanged channel is cheaper than starting another transaction
+        g = duty_list[channel - 1 - start_channel]
+        last[2].extend([0x00, 0x00, g & 0xFF, g >> 8, 0x00, 0x00, d & 0xFF, d >> 8])
+        last[0] = channel
+      elif self._on[channel] == 0:
+        # ON is already 0: only OFF_L/OFF_H need to go out
+        blocks.append([channel, self.__LED0_OFF_L + 4 * channel, [d & 0xFF, d >> 8]])
+      else:
+        blocks.append([channel, self.__LED0_ON_L + 4 * channel, [0x00, 0x00, d & 0xFF, d >> 8]])
+      self._on[channel] = 0
+      self._off[channel] = d
+    sent = 0
+    for channel, reg, block in blocks:
+      self.bus.write_i2c_block_data(self.address, reg, block)
+      sent += len(block)
+    self.bytes_written += sent
+    self.bytes_saved += 4 * len(duty_list) - sent
+    self.blocks_written += len(blocks)
+
+  def setAllPWM(self, on, off):
+    "Set every channel at once through the ALL_LED registers (off=4096 is full off)"
+    self.bus.write_i2c_block_data(self.address, self.__ALLLED_ON_L, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+    self._on = [on] * 16
+    self._off = [off] * 16
+
+  def setChannelsOff(self, start_channel, count):
+    "Turn consecutive channels full off in block writes"
+    block = [0x00, 0x00, 0x00, 0x10] * count     # ON = 0, OFF_H bit 4 = full off
     reg = self.__LED0_ON_L + 4 * start_channel
-    block = []
-    for duty in duty_list:
-      d = int(duty)
-      block.extend([0x00, 0x00, d & 0xFF, d >> 8])  # ON_L, ON_H, OFF_L, OFF_H
-    # Limit to 16 bytes per call to stay within the RPi BCM2835 I2C TX FIFO size.
-    # Larger chunks require a mid-transaction FIFO refill which can corrupt the
-    # PWM registers with a partial OFF_L/OFF_H state, causing servo jitter.
     for offset in range(0, len(block), 16):
       self.bus.write_i2c_block_data(self.address, reg + offset, block[offset:offset + 16])
+    for channel in range(start_channel, start_channel + count):
+      self._on[channel] = 0
+      self._off[channel] = 4096
+
+  def invalidate(self):
+    "Forget the shadow registers so the next setChannelsPWM rewrites every channel"
+    self._on = [None] * 16
+    self._off = [None] * 16
+
+  def stats(self):
+    return {'bytes_written': self.bytes_written,
+            'bytes_saved': self.bytes_saved,
+            'blocks_written': self.blocks_written}
+
   def setMotorPwm(self,channel,duty):
     self.setPWM(channel,0,duty)
   def setServoPulse(self, channel, pulse):
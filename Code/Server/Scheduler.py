@@ -0,0 +1,81 @@
+#coding:utf-8
+import time
+
+class FrameScheduler:
+    ''' Fixed-rate frame pacing against absolute monotonic deadlines.
+
+    Call wait() once at the end of every frame. It sleeps until the frame's
+    deadline and returns how many frame slots the caller should advance:
+    1 when on time, more than 1 when the DROP policy skipped late slots.'''
+    DROP = 'drop'          # late slots are skipped, the schedule stays locked to the clock
+    CATCH_UP = 'catchup'   # late slots run back to back until the schedule is met again
+
+    def __init__(self, period, policy=DROP, max_catchup=3, resync=0.25):
+        self.period = period
+        self.policy = policy
+        self.max_catchup = max_catchup   # CATCH_UP: most slots made up before giving up
+        self.resync = resync             # lateness (s) treated as a new start, not an overrun
+        self.deadline = None
+        self.resetStats()
+
+    def resetStats(self):
+        self.frames = 0
+        self.overruns = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.max_overrun = 0.0
+        self.total_overrun = 0.0
+        self.last_overrun = 0.0
+
+    def start(self):
+        "Anchor the schedule so the next deadline is one period from now"
+        self.deadline = time.monotonic() + self.period
+
+    def wait(self):
+        if not self.period:
+            # Unpaced (simulation and benchmarks): every frame runs at once
+            self.frames += 1
+            return 1
+        now = time.monotonic()
+        if self.deadline is None or now - self.deadline > self.resync:
+            # First frame, or the loop was idle: start a fresh schedule
+            if self.deadline is not None:
+                self.resyncs += 1
+            self.deadline = now + self.period
+        self.frames += 1
+        late = now - self.deadline
+        if late <= 0:
+            self.last_overrun = 0.0
+            time.sleep(-late)
+            self.deadline += self.period
+            return 1
+        self.overruns += 1
+        self.last_overrun = late
+        self.total_overrun += late
+        self.max_overrun = max(self.max_overrun, late)
+        missed = int(late // self.period)
+        if self.policy == self.CATCH_UP:
+            if missed < self.max_catchup:
+                self.deadline += self.period
+                return 1
+            # Too far behind to make up: give up the backlog
+            self.dropped += missed
+            self.deadline += (missed + 1) * self.period
+            return 1
+        self.dropped += missed
+        self.deadline += (missed + 1) * self.period
+        return missed + 1
+
+    def stats(self):
+        return {'period': self.period,
+                'policy': self.policy,
+                'frames': self.frames,
+                'overruns': self.overruns,
+                'dropped': self.dropped,
+                'resyncs': self.resyncs,
+                'max_overrun': self.max_overrun,
+                'mean_overrun': self.total_overrun / self.overruns if self.overruns else 0.0,
+                'last_overrun': self.last_overrun}
+
+if __name__ == '__main__':
+    pass
@@ -35,9 +35,12 @@ class Server:
         self.thread_led=None
         self.led=Led()
         self.adc=ADC()
-        self.servo=Servo()
+        # Battery voltages are sampled in the background; CMD_POWER answers from the cache
+        self.battery=BatteryMonitor(self.adc)
         self.buzzer=Buzzer()
         self.control=Control()
+        # One Servo for everything, so both PCA9685 shadow register copies stay true
+        self.servo=self.control.servo
         self.sonic=Ultrasonic()
         self.control.Thread_conditiona.start()
     def get_interface_ip(self):
@@ -142,15 +145,12 @@ class Server:
                     self.buzzer.run(data[1])
                 elif cmd.CMD_POWER in data:
                     try:
-                        batteryVoltage=self.adc.batteryPower()
+                        batteryVoltage=self.battery.power()
                         command=cmd.CMD_POWER+"#"+str(batteryVoltage[0])+"#"+str(batteryVoltage[1])+"\n"
                         self.send_data(self.connection1,command)
-                        if batteryVoltage[0] < 5.5 or batteryVoltage[1]<6:
-                            for i in range(3):
-                                self.buzzer.run("1")
-                                time.sleep(0.15)
-                                self.buzzer.run("0")
-                                time.sleep(0.1)
+                        if self.battery.isLow():
+                            # Beeps on their own thread, so the next command is not held up
+                            self.buzzer.beep()
                     except:
                         pass
                 elif cmd.CMD_LED in data or cmd.CMD_LED_MOD in data:
@@ -168,8 +168,7 @@ class Server:
                     if len(data)==3:
                         x=self.control.restriction(int(data[1]),50,180)
                         y=self.control.restriction(int(data[2]),0,180)
-                        self.servo.setServoAngle(0,x)
-                        self.servo.setServoAngle(1,y)
+                        self.servo.setServoAngles([0,1],[x,y])
                 elif cmd.CMD_RELAX in data:
                     if self.control.relax_flag==False:
                         self.control.relax(True)
@@ -183,8 +182,7 @@ class Server:
                     else:
                         GPIO.output(self.control.GPIO_4,False)
                 else:
-                    self.control.order=data
-                    self.control.timeout=time.time()
+                    self.control.mailbox.post(data)
         if self.thread_led is not None and self.thread_led.is_alive():
             stop_thread(self.thread_led)
         try:
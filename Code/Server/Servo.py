@@ -1,8 +1,11 @@
 #coding:utf-8
 from PCA9685 import PCA9685
+from Bus import batch
 import time 
 import math
-import smbus
+import threading
+import numpy as np
+from collections import namedtuple
 def mapNum(value,fromLow,fromHigh,toLow,toHigh):
     return (toHigh-toLow)*(value-fromLow) / (fromHigh-fromLow) + toLow
 
@@ -11,10 +14,115 @@ def mapNum(value,fromLow,fromHigh,toLow,toHigh):
 _SERVO_SCALE  = 4095.0 * 2000.0 / (20000.0 * 180.0)  # ≈ 2.275 counts/degree
 _SERVO_OFFSET = 4095.0 * 500.0  / 20000.0             # ≈ 102.375 counts
 
+# Servo channel map. servo is the number used by setServoAngle (0x41 ch0-15 are
+# servos 0-15, 0x40 ch0-15 are servos 16-31). Leg joints are driven as
+# servo angle = base + sign*(ik angle + calibration); home is the installation angle.
+ServoChannel = namedtuple('ServoChannel', ['servo', 'leg', 'joint', 'address', 'channel', 'base', 'sign', 'home'])
+
+SERVO_MAP = [
+    ServoChannel(0,  'head', 'pan',  0x41, 0,  0,   1,  90),
+    ServoChannel(1,  'head', 'tilt', 0x41, 1,  0,   1,  90),
+    # Legs 1-3: the femur is mirrored around 90 deg
+    ServoChannel(15, 0, 0, 0x41, 15, 0,   1,  90),
+    ServoChannel(14, 0, 1, 0x41, 14, 90,  -1, 90),
+    ServoChannel(13, 0, 2, 0x41, 13, 0,   1,  0),
+    ServoChannel(12, 1, 0, 0x41, 12, 0,   1,  90),
+    ServoChannel(11, 1, 1, 0x41, 11, 90,  -1, 90),
+    ServoChannel(10, 1, 2, 0x41, 10, 0,   1,  0),
+    ServoChannel(9,  2, 0, 0x41, 9,  0,   1,  90),
+    ServoChannel(8,  2, 1, 0x41, 8,  90,  -1, 90),
+    ServoChannel(31, 2, 2, 0x40, 15, 0,   1,  0),
+    # Legs 4-6: the tibia is mirrored around 180 deg
+    ServoChannel(22, 3, 0, 0x40, 6,  0,   1,  90),
+    ServoChannel(23, 3, 1, 0x40, 7,  90,  1,  90),
+    ServoChannel(27, 3, 2, 0x40, 11, 180, -1, 180),
+    ServoChannel(19, 4, 0, 0x40, 3,  0,   1,  90),
+    ServoChannel(20, 4, 1, 0x40, 4,  90,  1,  90),
+    ServoChannel(21, 4, 2, 0x40, 5,  180, -1, 180),
+    ServoChannel(16, 5, 0, 0x40, 0,  0,   1,  90),
+    ServoChannel(17, 5, 1, 0x40, 1,  90,  1,  90),
+    ServoChannel(18, 5, 2, 0x40, 2,  180, -1, 180),
+]
+
+def servoChannel(servo):
+    "Map entry for a servo number; unmapped numbers in 0-31 get a plain entry on their chip/channel, others None"
+    for c in SERVO_MAP:
+        if c.servo == servo:
+            return c
+    if not 0 <= servo < 32:
+        return None
+    return ServoChannel(servo, None, None, 0x41 if servo < 16 else 0x40, servo % 16, 0, 1, 90)
+
+def legMirror():
+    "6×3 base and sign arrays for the leg joints, from SERVO_MAP"
+    base = np.zeros((6, 3), dtype=int)
+    sign = np.ones((6, 3), dtype=int)
+    for c in SERVO_MAP:
+        if c.leg != 'head':
+            base[c.leg][c.joint] = c.base
+            sign[c.leg][c.joint] = c.sign
+    return base, sign
+
+class ServoPlan:
+    ''' A set of servos compiled into the fewest block writes.
+
+    Servos are ordered by chip and channel, and each run of consecutive
+    channels becomes one setChannelsPWM call. Duty arrays for write() are in
+    self.channels order.'''
+    def __init__(self, channels):
+        self.channels = sorted(channels, key=lambda c: (c.address, c.channel))
+        self.runs = []      # (address, first channel, slice of the duty array)
+        begin = 0
+        for i, c in enumerate(self.channels):
+            last = i + 1 == len(self.channels)
+            if last or self.channels[i+1].address != c.address or self.channels[i+1].channel != c.channel + 1:
+                first = self.channels[begin]
+                self.runs.append((first.address, first.channel, slice(begin, i + 1)))
+                begin = i + 1
+
+    def write(self, pwm, duty):
+        "Write duty values (in self.channels order) through {address: PCA9685}"
+        for address, channel, part in self.runs:
+            pwm[address].setChannelsPWM(channel, duty[part])
+
+_LEG_PLAN = ServoPlan([c for c in SERVO_MAP if c.leg != 'head'])
+# (leg, joint) feeding each slot of a setLegServoDuty frame, in I2C write order
+_LEG_DUTY_ORDER = np.array([(c.leg, c.joint) for c in _LEG_PLAN.channels])
+
+class DutyTable:
+    ''' Per-servo lookup from IK joint angle straight to PWM duty.
+
+    Calibration offset, mirroring, the 0-180 clamp and the angle→duty scale
+    are folded into one row per leg servo, so a frame is a single gather.
+    steps sets the table resolution in entries per degree; with steps=1 and
+    whole-degree angles the result matches the step-by-step conversion.'''
+    def __init__(self, offset, base, sign, steps=1, low=-360, high=360):
+        self.steps = steps
+        self.low = low
+        leg, joint = _LEG_DUTY_ORDER[:, 0], _LEG_DUTY_ORDER[:, 1]
+        offset = np.asarray(offset, dtype=float)[leg, joint][:, None]
+        base = np.asarray(base)[leg, joint][:, None]
+        sign = np.asarray(sign)[leg, joint][:, None]
+        ik = low + np.arange((high - low) * steps + 1) / steps
+        angle = np.clip(base + sign * (ik + offset), 0, 180)
+        self.table = (_SERVO_SCALE * angle + _SERVO_OFFSET).astype(np.uint16)
+        self._rows = np.arange(len(_LEG_DUTY_ORDER))
+
+    def duty(self, angle):
+        "Duty frame (setLegServoDuty order) for a 6×3 [leg][joint] array of IK angles"
+        angle = np.asarray(angle)[_LEG_DUTY_ORDER[:, 0], _LEG_DUTY_ORDER[:, 1]]
+        index = np.rint((angle - self.low) * self.steps).astype(np.intp)
+        np.clip(index, 0, self.table.shape[1] - 1, out=index)
+        return self.table[self._rows, index]
+
 class Servo:
     def __init__(self):
         self.pwm_40 = PCA9685(0x40, debug=True)
         self.pwm_41 = PCA9685(0x41, debug=True)
+        self.pwm = {0x40: self.pwm_40, 0x41: self.pwm_41}
+        self._plans = {}
+        # Writers come from several threads (servo output, network); the shadow registers need one at a time
+        self._lock = threading.RLock()
         # Set the cycle frequency of PWM  
         self.pwm_40.setPWMFreq(50) 
         time.sleep(0.01) 
@@ -23,67 +131,67 @@ class Servo:
 
     #Convert the input angle to the value of pca9685
     def setServoAngle(self,channel, angle):
-        date = int(_SERVO_SCALE * angle + _SERVO_OFFSET)  # angle→duty in one step
-        if channel < 16:
-            self.pwm_41.setPWM(channel, 0, date)
-        elif channel >= 16 and channel < 32:
-            self.pwm_40.setPWM(channel - 16, 0, date)
-        #time.sleep(0.0001)
+        self.setServoAngles([channel], [angle])
+
+    def setServoAngles(self, servos, angles):
+        "Set several servos (setServoAngle numbering) in the fewest block writes; numbers outside 0-31 are ignored"
+        key = tuple(servos)
+        plan = self._plans.get(key)
+        if plan is None:
+            channels = [servoChannel(s) for s in servos]
+            plan = self._plans[key] = ServoPlan([c for c in channels if c is not None])
+        duty = dict(zip(servos, angles))
+        duty = [int(_SERVO_SCALE * duty[c.servo] + _SERVO_OFFSET) for c in plan.channels]  # angle→duty in one step
+        with self._lock, self.frame():
+            plan.write(self.pwm, duty)
+
     def setLegServoBatch(self, angle):
-        """Write all 18 leg servo angles in 4 I2C block writes instead of 72 individual writes.
+        """Write all 18 leg servo angles in the block writes of the leg plan.
         angle: 6×3 list indexed [leg][joint] — same layout as Control.angle.
-        Channel mapping mirrors the setLegAngle() servo calls exactly."""
-        def d(a):
-            return int(_SERVO_SCALE * a + _SERVO_OFFSET)
-
-        # PCA9685 @ 0x41 — channels 8-15 (all 8 leg servos on this chip, contiguous)
-        # ch8=leg3 femur, ch9=leg3 coxa, ch10=leg2 tibia, ch11=leg2 femur,
-        # ch12=leg2 coxa, ch13=leg1 tibia, ch14=leg1 femur, ch15=leg1 coxa
-        self.pwm_41.setChannelsPWM(8, [
-            d(angle[2][1]),  # ch8:  leg3 femur
-            d(angle[2][0]),  # ch9:  leg3 coxa
-            d(angle[1][2]),  # ch10: leg2 tibia
-            d(angle[1][1]),  # ch11: leg2 femur
-            d(angle[1][0]),  # ch12: leg2 coxa
-            d(angle[0][2]),  # ch13: leg1 tibia
-            d(angle[0][1]),  # ch14: leg1 femur
-            d(angle[0][0]),  # ch15: leg1 coxa
-        ])
-
-        # PCA9685 @ 0x40 — channels 0-7 (legs 6, 5, 4 coxa+femur, contiguous)
-        # ch0=leg6 coxa, ch1=leg6 femur, ch2=leg6 tibia,
-        # ch3=leg5 coxa, ch4=leg5 femur, ch5=leg5 tibia,
-        # ch6=leg4 coxa, ch7=leg4 femur
-        self.pwm_40.setChannelsPWM(0, [
-            d(angle[5][0]),  # ch0: leg6 coxa
-            d(angle[5][1]),  # ch1: leg6 femur
-            d(angle[5][2]),  # ch2: leg6 tibia
-            d(angle[4][0]),  # ch3: leg5 coxa
-            d(angle[4][1]),  # ch4: leg5 femur
-            d(angle[4][2]),  # ch5: leg5 tibia
-            d(angle[3][0]),  # ch6: leg4 coxa
-            d(angle[3][1]),  # ch7: leg4 femur
-        ])
-
-        # PCA9685 @ 0x40 — non-contiguous channels (individual 4-byte block writes)
-        self.pwm_40.setChannelsPWM(11, [d(angle[3][2])])  # ch11: leg4 tibia  (servo 27)
-        self.pwm_40.setChannelsPWM(15, [d(angle[2][2])])  # ch15: leg3 tibia  (servo 31)
-
-    def relax(self):
-        for i in range(8):
-            self.pwm_41.setPWM(i+8, 4096, 4096)
-            self.pwm_40.setPWM(i, 4096, 4096)
-            self.pwm_40.setPWM(i+8, 4096, 4096)
-            
+        Returns the duty values written, in setLegServoDuty order."""
+        duty = self.legDuty(angle)
+        self.setLegServoDuty(duty)
+        return duty
+
+    def legDuty(self, angle):
+        "Convert a 6×3 [leg][joint] angle array to the 18 duty values in setLegServoDuty order"
+        angle = np.asarray(angle)[_LEG_DUTY_ORDER[:, 0], _LEG_DUTY_ORDER[:, 1]]
+        return (_SERVO_SCALE * angle + _SERVO_OFFSET).astype(np.uint16)
+
+    def legRate(self, rate):
+        "Duty counts/s per servo (setLegServoDuty order) for joint speeds in deg/s, scalar or 6×3 [leg][joint]"
+        rate = np.broadcast_to(np.asarray(rate, dtype=float), (6, 3))
+        return _SERVO_SCALE * rate[_LEG_DUTY_ORDER[:, 0], _LEG_DUTY_ORDER[:, 1]]
+
+    def legMask(self, legs):
+        "Boolean mask over the setLegServoDuty slots that belong to the given legs"
+        return np.isin(_LEG_DUTY_ORDER[:, 0], legs)
+
+    def setLegServoDuty(self, duty):
+        "Write 18 precomputed leg duty values (see _LEG_DUTY_ORDER)"
+        with self._lock, self.frame():
+            _LEG_PLAN.write(self.pwm, duty)
+
+    def frame(self):
+        "Context that sends the servo writes inside it as one bus request (both chips share the servo client)"
+        return batch(self.pwm_40.bus)
+
+    def relax(self, keep_head=True):
+        "Turn the servos full off: one ALL_LED write per chip, leaving the head servos on if asked"
+        keep = [c for c in SERVO_MAP if keep_head and c.leg == 'head']
+        with self._lock, self.frame():
+            for address, pwm in self.pwm.items():
+                if not any(c.address == address for c in keep):
+                    pwm.setAllPWM(0, 4096)
+                    continue
+                # Leg channels only, so the head keeps its pulse
+                plan = ServoPlan([c for c in SERVO_MAP if c.address == address and c not in keep])
+                for _, channel, part in plan.runs:
+                    pwm.setChannelsOff(channel, part.stop - part.start)
+
 def servo_installation_position():
     S=Servo()     
-    for i in range(32):
-        if (i == 10 or i == 13 or i == 31):
-            S.setServoAngle(i,0)
-        elif (i == 18 or i == 21 or i == 27):
-            S.setServoAngle(i,180)
-        else:
-            S.setServoAngle(i,90)
+    S.setServoAngles([c.servo for c in SERVO_MAP], [c.home for c in SERVO_MAP])
     time.sleep(3)
 # Main program logic follows:
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+#coding:utf-8
+import numpy as np
+
+class Workspace:
+    ''' Reachable workspace of the legs in leg coordinates (the frame of
+    Control.leg_point).
+
+    A foot is reachable when it is inside the 90-248 mm leg length band,
+    the IK solves it without clamping and, per leg, every joint stays
+    inside the 0-180 servo range once calibration and mirroring are
+    applied. exact() answers that with the IK itself.
+
+    reachable() puts a voxel grid in front of it as a conservative
+    pre-filter. A voxel is marked safe only when its centre and its 8
+    corners all pass the exact test with a small margin. A foot in a safe voxel is accepted
+    by lookup. Any other foot goes to exact(), so the grid can only save
+    work and never accepts a foot the IK would clamp.'''
+    def __init__(self, solve, resolution=8.0, near=90, reach=248, margin=1e-3, limit_margin=0.5, chunk=65536):
+        self.solve = solve              # solve(ox, oy, oz, margin=...) -> (N×3 float angles, no-clamp mask)
+        self.resolution = resolution
+        self.near = near
+        self.reach = reach
+        self.limit_margin = limit_margin
+        n = int(np.ceil(reach / resolution))
+        self.size = 2 * n + 1
+        self.origin = -n * resolution
+        # Voxel centres, then the corners between them
+        self._centre = self._lattice(self.origin, self.size, margin, chunk)
+        self._corner = self._lattice(self.origin - resolution / 2, self.size + 1, margin, chunk)
+        self._solvable = self._voxels(self._centre[0], self._corner[0])
+        self._reachable = np.zeros((6, self.size ** 3), dtype=bool)
+        self.offset = None
+
+    def _lattice(self, origin, size, margin, chunk):
+        "No-clamp mask and IK angles on a size^3 grid of points from origin"
+        axis = origin + self.resolution * np.arange(size)
+        x, y, z = [v.ravel() for v in np.meshgrid(axis, axis, axis, indexing='ij')]
+        length = np.sqrt(x*x + y*y + z*z)
+        solved = (length >= self.near) & (length <= self.reach)
+        angle = np.zeros((x.size, 3), dtype=np.float32)
+        index = np.flatnonzero(solved)
+        for start in range(0, index.size, chunk):
+            i = index[start:start + chunk]
+            # leg_point (x, y, z) is solved as coordinateToAngle(-z, x, y)
+            a, ok = self.solve(-z[i], x[i], y[i], margin=margin)
+            solved[i] &= ok
+            angle[i] = a
+        return solved, angle
+
+    def _voxels(self, centre, corner):
+        "Voxels whose centre and 8 corners are all set"
+        corner = corner.reshape((self.size + 1,) * 3)
+        safe = centre.reshape((self.size,) * 3).copy()
+        end = self.size
+        for dx in range(2):
+            for dy in range(2):
+                for dz in range(2):
+                    safe &= corner[dx:dx + end, dy:dy + end, dz:dz + end]
+        return safe.ravel()
+
+    def setLimits(self, offset, base, sign):
+        "Apply per-leg joint limits: servo = base + sign*(angle + offset) must stay in 0..180"
+        self.offset = np.asarray(offset, dtype=float)
+        self.base = np.asarray(base, dtype=float)
+        self.sign = np.asarray(sign, dtype=float)
+        m = self.limit_margin
+        def inside(lattice, leg):
+            solved, angle = lattice
+            servo = self.base[leg] + self.sign[leg] * (angle + self.offset[leg])
+            return solved & ((servo >= m) & (servo <= 180 - m)).all(axis=1)
+        for leg in range(6):
+            self._reachable[leg] = self._voxels(inside(self._centre, leg), inside(self._corner, leg))
+
+    def exact(self, leg_point, limits=True):
+        "Per-foot reachability of an (..., 6, 3) array of leg points from the IK itself"
+        leg_point = np.asarray(leg_point, dtype=float)
+        leg = np.broadcast_to(np.arange(6), leg_point.shape[:-1])
+        return self._exact(leg_point.reshape(-1, 3), leg.ravel(), limits).reshape(leg.shape)
+
+    def _exact(self, point, leg, limits):
+        length = np.sqrt((point * point).sum(axis=-1))
+        angle, ok = self.solve(-point[:, 2], point[:, 0], point[:, 1])
+        ok &= (length >= self.near) & (length <= self.reach)
+        if limits and self.offset is not None:
+            servo = self.base[leg] + self.sign[leg] * (angle + self.offset[leg])
+            ok &= ((servo >= 0) & (servo <= 180)).all(axis=1)
+        return ok
+
+    def reachable(self, leg_point, limits=True):
+        "Per-foot reachability for an (..., 6, 3) array of leg points; limits=False skips the joint limits"
+        leg_point = np.asarray(leg_point, dtype=float)
+        grid = np.rint((leg_point - self.origin) / self.resolution).astype(np.int64)
+        inside = ((grid >= 0) & (grid < self.size)).all(axis=-1)
+        grid = np.where(inside[..., None], grid, 0)
+        voxel = (grid[..., 0] * self.size + grid[..., 1]) * self.size + grid[..., 2]
+        leg = np.broadcast_to(np.arange(6), voxel.shape)
+        if limits:
+            safe = inside & self._reachable[leg, voxel]
+        else:
+            safe = inside & self._solvable[voxel]
+        result = safe.copy()
+        rest = ~safe
+        if rest.any():
+            result[rest] = self._exact(leg_point[rest], leg[rest], limits)
+        return result
+
+if __name__ == '__main__':
+    pass